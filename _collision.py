@@ -0,0 +1,405 @@
+'''
+uniform grid broad phase for ball collision
+
+balls are binned into cells of at least one ball diameter,
+counted, prefix-summed and scattered in separate compute passes,
+so each ball only tests the 3x3 cells around it.
+
+advance_reference() is a numpy implementation of the same step
+for checking the compute passes without a GL 4.3 context.
+'''
+
+import math
+
+import numpy as np
+
+
+WALL_ELASTICITY = 0.3
+GRAVITY = 0.02
+AIR_FRICTION = 0.88
+
+# pos(4) vel(4) col(4)
+STRUCT_SIZE = 12
+
+
+common_code = """
+#version 430
+#define COUNT %COUNT%
+#define GRID %GRID%
+#define CELLS %CELLS%
+#define LOCAL_SIZE %LOCAL_SIZE%
+
+layout(local_size_x=LOCAL_SIZE) in;
+
+struct Ball
+{
+    vec4 pos;
+    vec4 vel;
+    vec4 col;
+};
+
+layout(std430, binding=0) buffer balls_in
+{
+    Ball balls[];
+} In;
+layout(std430, binding=1) buffer balls_out
+{
+    Ball balls[];
+} Out;
+
+layout(std430, binding=2) buffer cell_count_buffer { uint cell_count[]; };
+layout(std430, binding=3) buffer cell_start_buffer { uint cell_start[]; };
+
+// x: cell index, y: rank inside the cell
+layout(std430, binding=4) buffer ball_slot_buffer { uvec2 ball_slot[]; };
+layout(std430, binding=5) buffer sorted_balls_buffer { uint sorted_balls[]; };
+
+ivec2 cell_coord(vec2 p)
+{
+    ivec2 c = ivec2(floor((p + 1.0) * 0.5 * float(GRID)));
+    return clamp(c, ivec2(0), ivec2(GRID - 1));
+}
+
+uint cell_of(vec2 p)
+{
+    ivec2 c = cell_coord(p);
+    return uint(c.x + c.y * GRID);
+}
+"""
+
+clear_code = common_code + """
+void main()
+{
+    uint c = gl_GlobalInvocationID.x;
+    if (c >= CELLS) { return; }
+
+    cell_count[c] = 0u;
+}
+"""
+
+count_code = common_code + """
+void main()
+{
+    uint i = gl_GlobalInvocationID.x;
+    if (i >= COUNT) { return; }
+
+    uint c = cell_of(In.balls[i].pos.xy);
+    ball_slot[i] = uvec2(c, atomicAdd(cell_count[c], 1u));
+}
+"""
+
+# single workgroup, each invocation scans a contiguous chunk of cells
+scan_code = common_code + """
+shared uint partial[LOCAL_SIZE];
+
+void main()
+{
+    uint t = gl_LocalInvocationID.x;
+    uint chunk = (CELLS + LOCAL_SIZE - 1u) / LOCAL_SIZE;
+    uint begin = min(t * chunk, CELLS);
+    uint end = min(begin + chunk, CELLS);
+
+    uint sum = 0u;
+    for (uint c = begin; c < end; c++)
+    {
+        sum += cell_count[c];
+    }
+    partial[t] = sum;
+    barrier();
+
+    for (uint offset = 1u; offset < LOCAL_SIZE; offset <<= 1u)
+    {
+        uint v = t >= offset ? partial[t - offset] : 0u;
+        barrier();
+        partial[t] += v;
+        barrier();
+    }
+
+    uint running = partial[t] - sum;
+    for (uint c = begin; c < end; c++)
+    {
+        cell_start[c] = running;
+        running += cell_count[c];
+    }
+}
+"""
+
+scatter_code = common_code + """
+void main()
+{
+    uint i = gl_GlobalInvocationID.x;
+    if (i >= COUNT) { return; }
+
+    uvec2 slot = ball_slot[i];
+    sorted_balls[cell_start[slot.x] + slot.y] = i;
+}
+"""
+
+advance_code = common_code + """
+#define WALL_ELASTICITY %WALL_ELASTICITY%
+#define GRAVITY %GRAVITY%
+#define AIR_FRICTION %AIR_FRICTION%
+
+void main()
+{
+    uint x = gl_GlobalInvocationID.x;
+    if (x >= COUNT) { return; }
+
+    Ball in_ball = In.balls[x];
+    vec4 p = in_ball.pos.xyzw;
+    vec4 v = in_ball.vel.xyzw;
+    vec4 c = in_ball.col.xyzw;
+
+    v.y += -GRAVITY;
+
+    float rad = p.w * 0.5;
+    float scale_v = length(v);
+
+    if (p.x + v.x - rad <= -1.0)
+    {
+        p.x = -1.0 + rad;
+        v.x *= -WALL_ELASTICITY;
+    }
+    else if (p.x + v.x + rad >= 1.0)
+    {
+        p.x = 1.0 - rad;
+        v.x *= -WALL_ELASTICITY;
+    }
+
+    if (p.y + v.y - rad <= -1.0)
+    {
+        p.y = -1.0 + rad;
+        v.y *= -WALL_ELASTICITY;
+    }
+    else if (p.y + v.y + rad >= 1.0)
+    {
+        p.y = 1.0 - rad;
+        v.y *= -WALL_ELASTICITY;
+    }
+
+    p.xy += v.xy;
+    v *= AIR_FRICTION;
+
+    // resolve against previous positions of balls in neighbouring cells,
+    // responses are averaged so the result does not depend on visit order
+    ivec2 home = cell_coord(p.xy);
+    vec2 push = vec2(0.0);
+    vec2 away = vec2(0.0);
+    float hits = 0.0;
+    for (int cy = max(home.y - 1, 0); cy <= min(home.y + 1, GRID - 1); cy++)
+    {
+        for (int cx = max(home.x - 1, 0); cx <= min(home.x + 1, GRID - 1); cx++)
+        {
+            uint cell = uint(cx + cy * GRID);
+            uint begin = cell_start[cell];
+            uint end = begin + cell_count[cell];
+            for (uint k = begin; k < end; k++)
+            {
+                uint y = sorted_balls[k];
+                if (x == y) { continue; }
+
+                vec4 op = In.balls[y].pos.xyzw;
+
+                vec2 d = op.xy - p.xy;
+                float sr = op.w * 0.5 + rad;
+                float dd = dot(d, d);
+                if (dd < sr * sr)
+                {
+                    vec2 unit_revert = dd > 0.0 ? d / sqrt(dd) : vec2(-1.0, 0.0);
+                    push += op.xy - unit_revert * sr - p.xy;
+                    away += unit_revert;
+                    hits += 1.0;
+                }
+            }
+        }
+    }
+
+    if (hits > 0.0)
+    {
+        p.xy += push / hits;
+        float la = length(away);
+        vec2 dir = la > 0.0 ? away / la : vec2(-1.0, 0.0);
+        v.xy = dir * scale_v * -0.25;
+    }
+
+    Ball out_ball;
+    out_ball.pos = p;
+    out_ball.vel = v;
+    out_ball.col = c;
+
+    Out.balls[x] = out_ball;
+}
+"""
+
+
+def grid_size(max_diameter):
+    ''' number of cells along one axis, a cell is never smaller than a ball '''
+    return max(1, int(2.0 / max_diameter))
+
+
+def _source(code, args):
+    for k, v in args.items():
+        code = code.replace(f"%{k}%", str(v))
+    return code
+
+
+class BroadPhaseCollision(object):
+    LOCAL_SIZE = 256
+
+    def __init__(self, context, count, grid):
+        self.context = context
+        self.count = count
+        self.cells = grid * grid
+
+        args = {
+            "COUNT": f"{count}u",
+            "GRID": grid,
+            "CELLS": f"{self.cells}u",
+            "LOCAL_SIZE": self.LOCAL_SIZE,
+            "WALL_ELASTICITY": WALL_ELASTICITY,
+            "GRAVITY": GRAVITY,
+            "AIR_FRICTION": AIR_FRICTION,
+        }
+        ball_groups = math.ceil(count / self.LOCAL_SIZE)
+        cell_groups = math.ceil(self.cells / self.LOCAL_SIZE)
+        self.passes = [
+            (context.compute_shader(_source(clear_code, args)), cell_groups),
+            (context.compute_shader(_source(count_code, args)), ball_groups),
+            (context.compute_shader(_source(scan_code, args)), 1),
+            (context.compute_shader(_source(scatter_code, args)), ball_groups),
+            (context.compute_shader(_source(advance_code, args)), ball_groups),
+        ]
+
+        self.cell_count = context.buffer(reserve=self.cells * 4)
+        self.cell_start = context.buffer(reserve=self.cells * 4)
+        self.ball_slot = context.buffer(reserve=count * 8)
+        self.sorted_balls = context.buffer(reserve=count * 4)
+
+    def run(self, in_buffer, out_buffer):
+        in_buffer.bind_to_storage_buffer(0)
+        out_buffer.bind_to_storage_buffer(1)
+        self.cell_count.bind_to_storage_buffer(2)
+        self.cell_start.bind_to_storage_buffer(3)
+        self.ball_slot.bind_to_storage_buffer(4)
+        self.sorted_balls.bind_to_storage_buffer(5)
+
+        for program, groups in self.passes:
+            program.run(group_x=groups)
+            self.context.memory_barrier()
+
+
+def _cell_coord(p, grid):
+    c = np.floor((p + np.float32(1.0)) * np.float32(0.5) * np.float32(grid))
+    return np.clip(c, 0, grid - 1).astype(np.int64)
+
+
+def advance_reference(balls, grid):
+    '''
+    numpy version of one BroadPhaseCollision step
+
+    balls: (count, 12) float32 array laid out as pos, vel, col
+    '''
+
+    balls = np.asarray(balls, dtype=np.float32)
+    old = balls[:, 0:4]
+    p = balls[:, 0:4].copy()
+    v = balls[:, 4:8].copy()
+
+    v[:, 1] -= np.float32(GRAVITY)
+
+    rad = p[:, 3] * np.float32(0.5)
+    scale_v = np.sqrt((v * v).sum(axis=1))
+
+    for axis in (0, 1):
+        low = p[:, axis] + v[:, axis] - rad <= -1.0
+        high = ~low & (p[:, axis] + v[:, axis] + rad >= 1.0)
+        p[low, axis] = -1.0 + rad[low]
+        p[high, axis] = 1.0 - rad[high]
+        v[low | high, axis] *= np.float32(-WALL_ELASTICITY)
+
+    p[:, 0:2] += v[:, 0:2]
+    v *= np.float32(AIR_FRICTION)
+
+    # bin previous positions, same layout as count/scan/scatter passes
+    old_coord = _cell_coord(old[:, 0:2], grid)
+    old_cell = old_coord[:, 0] + old_coord[:, 1] * grid
+    order = np.argsort(old_cell, kind="stable")
+    cell_count = np.bincount(old_cell, minlength=grid * grid)
+    cell_start = np.cumsum(cell_count) - cell_count
+
+    home = _cell_coord(p[:, 0:2], grid)
+    push = np.zeros((len(balls), 2), dtype=np.float32)
+    away = np.zeros((len(balls), 2), dtype=np.float32)
+    hits = np.zeros(len(balls), dtype=np.float32)
+    for dy in (-1, 0, 1):
+        for dx in (-1, 0, 1):
+            neighbour = home + (dx, dy)
+            valid = ((neighbour >= 0) & (neighbour < grid)).all(axis=1)
+            ii = np.nonzero(valid)[0]
+            cell = neighbour[valid, 0] + neighbour[valid, 1] * grid
+
+            # expand every (ball, neighbouring cell) into candidate pairs
+            n = cell_count[cell]
+            run_offset = np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)
+            jj = order[np.repeat(cell_start[cell], n) + run_offset]
+            ii = np.repeat(ii, n)
+
+            keep = ii != jj
+            ii, jj = ii[keep], jj[keep]
+
+            d = old[jj, 0:2] - p[ii, 0:2]
+            sr = old[jj, 3] * np.float32(0.5) + rad[ii]
+            dd = (d * d).sum(axis=1)
+
+            hit = dd < sr * sr
+            ii, jj, d, sr, dd = ii[hit], jj[hit], d[hit], sr[hit], dd[hit]
+
+            length = np.sqrt(dd)[:, None]
+            unit = np.where(
+                length > 0.0, d / np.where(length > 0.0, length, 1.0),
+                np.array([-1.0, 0.0], dtype=np.float32))
+            np.add.at(push, ii, old[jj, 0:2] - unit * sr[:, None] - p[ii, 0:2])
+            np.add.at(away, ii, unit)
+            np.add.at(hits, ii, 1.0)
+
+    hit = hits > 0.0
+    p[hit, 0:2] += push[hit] / hits[hit, None]
+    la = np.sqrt((away * away).sum(axis=1))[:, None]
+    direction = np.where(
+        la > 0.0, away / np.where(la > 0.0, la, 1.0),
+        np.array([-1.0, 0.0], dtype=np.float32))
+    v[hit, 0:2] = direction[hit] * scale_v[hit, None] * np.float32(-0.25)
+
+    result = balls.copy()
+    result[:, 0:4] = p
+    result[:, 4:8] = v
+    return result
+
+
+if __name__ == "__main__":
+    import moderngl as mg
+
+    count = 20000
+    max_diameter = 0.012
+    grid = grid_size(max_diameter)
+
+    rng = np.random.default_rng(0)
+    balls = np.zeros((count, STRUCT_SIZE), dtype=np.float32)
+    balls[:, 0:2] = rng.uniform(-0.9, 0.9, (count, 2))
+    balls[:, 3] = rng.uniform(0.5, 1.0, count) * max_diameter
+    balls[:, 4:6] = rng.uniform(-0.01, 0.01, (count, 2))
+    balls[:, 8:12] = 1.0
+
+    context = mg.create_standalone_context(require=430)
+    collision = BroadPhaseCollision(context, count, grid)
+    buffer_a = context.buffer(balls.tobytes())
+    buffer_b = context.buffer(reserve=balls.nbytes)
+
+    reference = balls
+    for i in range(8):
+        collision.run(buffer_a, buffer_b)
+        buffer_a, buffer_b = buffer_b, buffer_a
+        reference = advance_reference(reference, grid)
+
+    result = np.frombuffer(buffer_a.read(), dtype=np.float32).reshape(reference.shape)
+    print(f"max abs error after 8 steps: {np.abs(result - reference).max():.6f}")
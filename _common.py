@@ -1,15 +1,11 @@
 
 import numpy as np
 
+from _glsource import _shader_source
 
-def _read(path, args):
-    with open(path, 'r') as fp:
-        content = fp.read()
-
-    for k, v in args.items():
-        content = content.replace(f"%{k}", str(v))
 
-    return content
+def _read(path, args):
+    return _shader_source().expand(path, args)
 
 def _flatten_array(data):
     data = np.multiply(data, 255.0)
@@ -0,0 +1,94 @@
+'''
+long-lived compute context for texture generation
+
+one standalone context is kept for the whole process,
+compiled compute programs and storage buffers are reused between runs.
+every gl call of the engine runs with its own context made current and the previous one restored,
+processes that also hold a qt context go through program, storage_buffer, run and read
+'''
+
+import hashlib
+
+from _context import create_headless_context
+
+
+class ComputeEngine(object):
+    def __init__(self, context=None):
+        self.context = context or create_headless_context(430)
+        self._programs = {}
+        self._latest = {}
+        self._buffers = {}
+
+    def program(self, reader, path, args):
+        '''
+        compile compute shader at path only when its source or args changed
+
+        reader: callable(path, args) -> expanded source, e.g. _common._read
+        '''
+
+        source = reader(path, args)
+        digest = hashlib.sha1(source.encode('utf-8')).hexdigest()
+        key = (digest, tuple(sorted(args.items())))
+
+        with self.context:
+            if key not in self._programs:
+                self._programs[key] = self.context.compute_shader(source)
+
+            # drop stale program of the same file, editor save storms would leak otherwise
+            previous = self._latest.get(path)
+            self._latest[path] = key
+            if previous and previous != key and previous not in self._latest.values():
+                self._programs.pop(previous).release()
+
+        return self._programs[key]
+
+    def storage_buffer(self, binding, size, initial=None):
+        '''
+        bind storage buffer of given byte size, reallocate only on size change
+
+        initial: callable returning data to upload when buffer is (re)created
+        '''
+
+        buffer = self._buffers.get(binding)
+        with self.context:
+            if buffer is None or buffer.size != size:
+                if buffer is not None:
+                    buffer.release()
+
+                data = initial() if initial else None
+                buffer = self.context.buffer(data, reserve=0 if data is not None else size)
+                self._buffers[binding] = buffer
+
+            buffer.bind_to_storage_buffer(binding)
+        return buffer
+
+    def run(self, program, x=1, y=1, z=1):
+        ''' dispatch program, its storage writes are visible to read() afterwards '''
+        with self.context:
+            program.run(x, y, z)
+            self.context.memory_barrier()
+
+    def read(self, buffer):
+        with self.context:
+            return buffer.read()
+
+    def release(self):
+        with self.context:
+            for program in self._programs.values():
+                program.release()
+            for buffer in self._buffers.values():
+                buffer.release()
+
+        self._programs = {}
+        self._latest = {}
+        self._buffers = {}
+
+
+_engine = None
+
+
+def _compute_engine():
+    global _engine
+    if _engine is None:
+        _engine = ComputeEngine()
+    return _engine
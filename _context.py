@@ -0,0 +1,26 @@
+'''
+standalone context creation for headless rendering
+
+on linux EGL is tried first, it needs no display and runs on Mesa llvmpipe
+'''
+
+import sys
+
+import moderngl as mg
+
+
+BACKENDS = ("auto", "egl", "default")
+
+
+def create_headless_context(require=330, backend="auto"):
+    if backend == "auto":
+        if sys.platform.startswith("linux"):
+            try:
+                return mg.create_standalone_context(require=require, backend="egl")
+            except Exception:
+                pass
+        backend = "default"
+
+    if backend == "default":
+        return mg.create_standalone_context(require=require)
+    return mg.create_standalone_context(require=require, backend=backend)
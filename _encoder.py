@@ -0,0 +1,220 @@
+'''
+streaming video encoding
+
+EncoderProcess runs the writer in a separate process,
+frames are copied into a fixed ring of shared memory slots
+and only slot indices travel between processes.
+put() blocks while every slot is waiting to be encoded,
+so memory stays flat no matter how many frames are rendered.
+
+StreamWriter encodes as frames arrive,
+pingpong and loop clips are replayed from a memory-mapped FrameStore.
+'''
+
+import time
+import queue
+import tempfile
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+def _encode(dst_path, names, shape, dtype, free_slots, filled_slots, encoded, writer_kwargs):
+    import imageio as ii
+
+    # children share the parent's resource tracker, the parent unlinks on close
+    blocks = [shared_memory.SharedMemory(name=name) for name in names]
+    frames = [np.ndarray(shape, dtype=dtype, buffer=block.buf) for block in blocks]
+
+    writer = ii.get_writer(dst_path, **writer_kwargs)
+    while True:
+        slot = filled_slots.get()
+        if slot is None:
+            break
+
+        writer.append_data(frames[slot])
+        free_slots.put(slot)
+        with encoded.get_lock():
+            encoded.value += 1
+    writer.close()
+
+    del frames
+    for block in blocks:
+        block.close()
+
+
+class EncoderProcess(object):
+    def __init__(self, dst_path, shape, dtype=np.uint8, slots=8, **writer_kwargs):
+        self.dst_path = dst_path
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+
+        nbytes = int(np.prod(self.shape)) * self.dtype.itemsize
+        self._blocks = [shared_memory.SharedMemory(create=True, size=nbytes) for _ in range(slots)]
+        self._frames = [
+            np.ndarray(self.shape, dtype=self.dtype, buffer=block.buf)
+            for block in self._blocks
+        ]
+
+        self._free_slots = mp.Queue()
+        self._filled_slots = mp.Queue()
+        for slot in range(slots):
+            self._free_slots.put(slot)
+
+        self._encoded = mp.Value('i', 0)
+        self._submitted = 0
+        self._start_time = None
+
+        self._process = mp.Process(
+            target=_encode,
+            args=(
+                dst_path, [block.name for block in self._blocks],
+                self.shape, self.dtype.str,
+                self._free_slots, self._filled_slots, self._encoded, writer_kwargs
+            ),
+            daemon=True)
+
+    def start(self):
+        self._start_time = time.perf_counter()
+        self._process.start()
+        return self
+
+    def put(self, frame, poll=0.5):
+        '''
+        blocks while all slots are waiting for the encoder,
+        raises once the encoder process is gone instead of waiting for it forever
+        '''
+
+        while True:
+            try:
+                slot = self._free_slots.get(timeout=poll)
+                break
+            except queue.Empty:
+                if not self._process.is_alive():
+                    raise Exception(
+                        f"encoder process for {self.dst_path} exited with code {self._process.exitcode}")
+        self._frames[slot][...] = frame
+        self._filled_slots.put(slot)
+        self._submitted += 1
+
+    @property
+    def encoded(self):
+        return self._encoded.value
+
+    @property
+    def queue_depth(self):
+        ''' frames handed over but not encoded yet '''
+        return self._submitted - self.encoded
+
+    @property
+    def throughput(self):
+        ''' encoded frames per second since start '''
+        if not self._start_time:
+            return 0.0
+        return self.encoded / max(time.perf_counter() - self._start_time, 1e-6)
+
+    def close(self):
+        ''' waits until every queued frame is encoded '''
+        self._filled_slots.put(None)
+        self._process.join()
+
+        self._frames = []
+        for block in self._blocks:
+            block.close()
+            block.unlink()
+        self._blocks = []
+
+
+class FrameStore(object):
+    ''' append-only frames in a temporary memory-mapped file, grows by doubling '''
+
+    def __init__(self, shape, dtype=np.uint8, capacity=64):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.count = 0
+
+        self._file = tempfile.TemporaryFile()
+        self._map = None
+        self._grow(capacity)
+
+    def _grow(self, capacity):
+        if self._map is not None:
+            self._map.flush()
+
+        nbytes = int(np.prod(self.shape)) * self.dtype.itemsize
+        self._file.truncate(capacity * nbytes)
+        self._map = np.memmap(self._file, dtype=self.dtype, mode='r+', shape=(capacity, *self.shape))
+
+    def append(self, frame):
+        if self.count == len(self._map):
+            self._grow(len(self._map) * 2)
+
+        self._map[self.count] = frame
+        self.count += 1
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        return self._map[:self.count][i]
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield self._map[i]
+
+    def close(self):
+        self._map = None
+        self._file.close()
+
+
+class StreamWriter(object):
+    '''
+    encodes frames as they arrive instead of collecting them for mimwrite
+
+    mode:
+        "once": frames are written as given
+        "pingpong": followed by every frame in reverse order
+        "loop": whole clip repeated loops times
+
+    pingpong and loop replay from a FrameStore on disk at close()
+    '''
+
+    MODES = ("once", "pingpong", "loop")
+
+    def __init__(self, dst_path, mode="once", loops=2, **writer_kwargs):
+        import imageio as ii
+
+        if mode not in self.MODES:
+            raise Exception(f"unknown stream mode: {mode}")
+
+        self.mode = mode
+        self.loops = loops
+        self.writer = ii.get_writer(dst_path, **writer_kwargs)
+        self.store = None
+
+    def append(self, frame):
+        self.writer.append_data(frame)
+
+        if self.mode == "once":
+            return
+
+        if self.store is None:
+            self.store = FrameStore(frame.shape, frame.dtype)
+        self.store.append(frame)
+
+    def close(self):
+        if self.store is not None:
+            if self.mode == "pingpong":
+                for i in range(len(self.store) - 1, -1, -1):
+                    self.writer.append_data(self.store[i])
+
+            elif self.mode == "loop":
+                for _ in range(self.loops - 1):
+                    for frame in self.store:
+                        self.writer.append_data(frame)
+
+            self.store.close()
+            self.store = None
+
+        self.writer.close()
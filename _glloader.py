@@ -1,19 +1,12 @@
 
 import numpy as np
 
-
-_cache = {}
+from _glsource import _shader_source
 
 
 def _load_file(file):
-    if file in _cache:
-        return _cache[file]
-
-    with open(file, 'r') as fp:
-        program = fp.read()
-
-    _cache[file] = program
-    return program
+    # cached until the file or one of its includes changes on disk
+    return _shader_source().expand(file)
 
 
 class _Loader(object):
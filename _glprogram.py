@@ -0,0 +1,169 @@
+'''
+compiled program cache
+
+moderngl only builds programs from source and can't wrap a program object
+created from a driver binary (glProgramBinary), so binaries are left to the driver:
+Mesa and NVIDIA keep an on-disk cache of compiled programs keyed by source and driver build,
+a rejected or stale entry is simply compiled again.
+enable_disk_cache() points that cache at a directory and has to run before the first context.
+
+ProgramCache memoizes programs per context, keyed by the expanded sources and the renderer,
+so hot reloads of unchanged sources don't reach the driver at all.
+'''
+
+import os
+import time
+import hashlib
+import weakref
+
+
+def enable_disk_cache(directory=None):
+    '''
+    turn the driver's shader disk cache on, optionally in directory
+    only affects contexts created after the call
+    '''
+
+    # mesa >= 21 and older mesa
+    os.environ["MESA_SHADER_CACHE_DISABLE"] = "false"
+    os.environ["MESA_GLSL_CACHE_DISABLE"] = "false"
+
+    # nvidia
+    os.environ["__GL_SHADER_DISK_CACHE"] = "1"
+
+    if directory:
+        directory = os.path.abspath(directory)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        os.environ["MESA_SHADER_CACHE_DIR"] = directory
+        os.environ["MESA_GLSL_CACHE_DIR"] = directory
+        os.environ["__GL_SHADER_DISK_CACHE_PATH"] = directory
+    return directory
+
+
+class ProgramCache(object):
+    def __init__(self, context):
+        self.context = context
+        self.renderer = f"{context.info['GL_RENDERER']} {context.info['GL_VERSION']}"
+
+        self._programs = {}
+        self.hits = 0
+        self.misses = 0
+        self.compile_time = 0.0
+
+    def key(self, **stages):
+        digest = hashlib.sha1(self.renderer.encode("utf-8"))
+        for name in sorted(stages.keys()):
+            if stages[name] is None:
+                continue
+            digest.update(f"\0{name}\0".encode("utf-8"))
+            digest.update(stages[name].encode("utf-8"))
+        return digest.hexdigest()
+
+    def program(self, **stages):
+        '''
+        same arguments as context.program with sources expanded already,
+        returns the cached program when every stage source is unchanged
+        '''
+
+        key = self.key(**stages)
+        if key in self._programs:
+            self.hits += 1
+            return self._programs[key]
+
+        start = time.perf_counter()
+        program = self.context.program(**stages)
+        self.compile_time += time.perf_counter() - start
+        self.misses += 1
+
+        self._programs[key] = program
+        return program
+
+    def compute_shader(self, source):
+        key = self.key(compute_shader=source)
+        if key in self._programs:
+            self.hits += 1
+            return self._programs[key]
+
+        start = time.perf_counter()
+        program = self.context.compute_shader(source)
+        self.compile_time += time.perf_counter() - start
+        self.misses += 1
+
+        self._programs[key] = program
+        return program
+
+    def discard(self, program):
+        ''' release a program that won't be asked for again, e.g. the previous hot reload '''
+        for key, cached in list(self._programs.items()):
+            if cached is program:
+                del self._programs[key]
+                program.release()
+
+    def release(self):
+        for program in self._programs.values():
+            program.release()
+        self._programs = {}
+
+
+_caches = weakref.WeakKeyDictionary()
+
+
+def _program_cache(context):
+    ''' one ProgramCache per context '''
+    cache = _caches.get(context)
+    if cache is None:
+        cache = _caches[context] = ProgramCache(context)
+    return cache
+
+
+def _benchmark(vs_path, fs_path, size=(64, 64)):
+    ''' compile and first draw time, run in a fresh process against a given cache '''
+    import numpy as np
+
+    from _glsource import _shader_source
+    from _context import create_headless_context
+
+    context = create_headless_context(430)
+    vs = _shader_source().expand(vs_path)
+    fs = _shader_source().expand(fs_path)
+
+    start = time.perf_counter()
+    program = _program_cache(context).program(vertex_shader=vs, fragment_shader=fs)
+    compiled = time.perf_counter()
+
+    # llvmpipe generates the fragment code at the first draw
+    verts = np.array([-1.0, -1.0, 0.0, 0.0, 0.0, 3.0, -1.0, 0.0, 2.0, 0.0, -1.0, 3.0, 0.0, 0.0, 2.0])
+    vao = context.vertex_array(
+        program, [(context.buffer(verts.astype('f4').tobytes()), '3f 2f', 'in_verts', 'in_uvs')])
+    framebuffer = context.simple_framebuffer(size)
+    framebuffer.use()
+    vao.render()
+    context.finish()
+    drawn = time.perf_counter()
+
+    return compiled - start, drawn - compiled
+
+
+if __name__ == "__main__":
+    import sys
+    import shutil
+    import tempfile
+    import subprocess
+
+    # python _glprogram.py vs_path fs_path
+    if len(sys.argv) > 3 and sys.argv[1] == "--child":
+        enable_disk_cache(sys.argv[2])
+        compile_time, draw_time = _benchmark(sys.argv[3], sys.argv[4])
+        print(f"{compile_time} {draw_time}")
+        sys.exit(0)
+
+    directory = tempfile.mkdtemp()
+    try:
+        for run in ("cold", "warm", "warm"):
+            output = subprocess.check_output(
+                [sys.executable, __file__, "--child", directory, sys.argv[1], sys.argv[2]])
+            compile_time, draw_time = (float(v) for v in output.split())
+            print(f"{run}: compile {compile_time * 1000.0:8.2f} ms, first draw {draw_time * 1000.0:8.2f} ms")
+    finally:
+        shutil.rmtree(directory)
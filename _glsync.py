@@ -0,0 +1,70 @@
+'''
+GL sync fences
+
+moderngl does not expose glFenceSync, so PyOpenGL is used when it is installed.
+standalone EGL contexts need PYOPENGL_PLATFORM=egl to be set before import.
+without PyOpenGL a fence reports signaled immediately and wait() falls back to finish().
+'''
+
+
+_GL = None
+
+
+def _gl():
+    global _GL
+    if _GL is None:
+        try:
+            # errors left behind by moderngl calls would surface from our calls otherwise
+            import OpenGL
+            OpenGL.ERROR_CHECKING = False
+            from OpenGL import GL
+            _GL = GL
+        except ImportError:
+            _GL = False
+    return _GL
+
+
+def fences_supported():
+    return bool(_gl())
+
+
+class Fence(object):
+    def __init__(self, context):
+        self.context = context
+        self._sync = None
+        self._done = False
+
+        gl = _gl()
+        if gl:
+            self._sync = gl.glFenceSync(gl.GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+
+    def _client_wait(self, timeout_ns):
+        gl = _gl()
+        status = gl.glClientWaitSync(self._sync, gl.GL_SYNC_FLUSH_COMMANDS_BIT, timeout_ns)
+        if status in (gl.GL_ALREADY_SIGNALED, gl.GL_CONDITION_SATISFIED):
+            self.release()
+            self._done = True
+        return self._done
+
+    def signaled(self):
+        ''' non-blocking poll '''
+        if self._done or self._sync is None:
+            return True
+        return self._client_wait(0)
+
+    def wait(self):
+        if self._done:
+            return
+
+        if self._sync is None:
+            self.context.finish()
+            self._done = True
+            return
+
+        while not self._client_wait(1000000000):
+            pass
+
+    def release(self):
+        if self._sync is not None:
+            _gl().glDeleteSync(self._sync)
+            self._sync = None
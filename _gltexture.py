@@ -0,0 +1,175 @@
+'''
+texture asset cache
+
+TextureCache keeps the textures of one context keyed by path, mtime and requested size/orientation,
+the least recently used ones are released once the cache holds more than budget bytes on gpu.
+
+DecodedCache keeps decoded RGBA8 pixels on disk as .npy, already resized and flipped,
+keyed by the content hash of the source image.
+a warm load is a memory map handed straight to context.texture, no decode, convert or flip.
+'''
+
+import os
+import time
+import hashlib
+import tempfile
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+
+class DecodedCache(object):
+    def __init__(self, directory=None):
+        self.directory = directory or os.path.join(tempfile.gettempdir(), "decoded_textures")
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+    def _key(self, path, size, flip):
+        digest = hashlib.sha1()
+        with open(path, 'rb') as fp:
+            for block in iter(lambda: fp.read(1 << 20), b''):
+                digest.update(block)
+        digest.update(repr((size, flip)).encode('utf-8'))
+        return digest.hexdigest()
+
+    def load(self, path, size=None, flip=True):
+        '''
+        (height, width, 4) uint8, memory-mapped read only
+        flip: rows bottom first, the way gl expects them
+        '''
+
+        cached = os.path.join(self.directory, f"{self._key(path, size, flip)}.npy")
+        if not os.path.isfile(cached):
+            img = Image.open(path).convert("RGBA")
+            if size:
+                img = img.resize(size)
+
+            data = np.asarray(img)
+            if flip:
+                data = data[::-1]
+
+            # written aside and renamed, concurrent loaders never see half a file
+            temp = f"{cached}.{os.getpid()}.tmp"
+            with open(temp, 'wb') as fp:
+                np.save(fp, np.ascontiguousarray(data))
+            os.replace(temp, cached)
+
+        return np.load(cached, mmap_mode='r')
+
+
+class TextureCache(object):
+    def __init__(self, context, budget=256 << 20, decoded=None):
+        self.context = context
+        self.budget = budget
+        self.decoded = decoded or DecodedCache()
+
+        self._textures = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.load_time = 0.0
+
+    def get(self, path, size=None, flip=True):
+        '''
+        cached texture for the image at path, reloaded when the file changed
+
+        textures are shared, don't release them, evict() or release() the cache instead
+        '''
+
+        path = os.path.abspath(path)
+        size = tuple(size) if size else None
+        key = (path, os.stat(path).st_mtime_ns, size, flip)
+
+        if key in self._textures:
+            self._textures.move_to_end(key)
+            self.hits += 1
+            return self._textures[key][0]
+
+        # an older version of the same file won't be asked for again
+        for stale in [k for k in self._textures if k[0] == path and k[2:] == key[2:]]:
+            self._evict(stale)
+
+        start = time.perf_counter()
+        data = self.decoded.load(path, size, flip)
+        texture = self.context.texture((data.shape[1], data.shape[0]), 4, data)
+        self.load_time += time.perf_counter() - start
+        self.misses += 1
+
+        self._textures[key] = (texture, data.nbytes)
+        self.bytes += data.nbytes
+
+        # the texture just loaded stays, even when it alone is over budget
+        while self.bytes > self.budget and len(self._textures) > 1:
+            self._evict(next(iter(self._textures)))
+        return texture
+
+    def _evict(self, key):
+        texture, nbytes = self._textures.pop(key)
+        self.bytes -= nbytes
+        texture.release()
+
+    def evict(self, path):
+        ''' release every cached texture of path '''
+        path = os.path.abspath(path)
+        for key in [k for k in self._textures if k[0] == path]:
+            self._evict(key)
+
+    def release(self):
+        for key in list(self._textures):
+            self._evict(key)
+
+
+_caches = weakref.WeakKeyDictionary()
+
+
+def _texture_cache(context):
+    ''' one TextureCache per context '''
+    cache = _caches.get(context)
+    if cache is None:
+        cache = _caches[context] = TextureCache(context)
+    return cache
+
+
+if __name__ == "__main__":
+    import sys
+    import shutil
+
+    from _context import create_headless_context
+
+    # python _gltexture.py image_path
+    path = sys.argv[1]
+    context = create_headless_context(330)
+
+    start = time.perf_counter()
+    for _ in range(10):
+        img = Image.open(path).convert("RGBA").transpose(Image.FLIP_TOP_BOTTOM)
+        context.texture(img.size, 4, img.tobytes()).release()
+    uncached = (time.perf_counter() - start) / 10
+
+    directory = tempfile.mkdtemp()
+    try:
+        decoded = DecodedCache(directory)
+
+        start = time.perf_counter()
+        TextureCache(context, decoded=decoded).get(path).release()
+        cold = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(10):
+            TextureCache(context, decoded=decoded).get(path).release()
+        warm = (time.perf_counter() - start) / 10
+
+        cache = TextureCache(context, decoded=decoded)
+        cache.get(path)
+        start = time.perf_counter()
+        for _ in range(10):
+            cache.get(path)
+        hit = (time.perf_counter() - start) / 10
+    finally:
+        shutil.rmtree(directory)
+
+    print(
+        f"decode + upload {uncached * 1000.0:.2f} ms, cold {cold * 1000.0:.2f} ms, "
+        f"memory-mapped {warm * 1000.0:.2f} ms, cached texture {hit * 1000.0:.3f} ms")
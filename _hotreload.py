@@ -0,0 +1,140 @@
+'''
+debounced, targeted shader hot reload
+
+an editor save usually arrives as 2-4 watchdog events,
+ReloadCoordinator collects a burst and fires once the files were quiet for window seconds,
+and only for paths inside the include graph of the shaders it follows.
+
+ShaderPrecheck compiles and links sources on a worker thread, in its own headless context
+that shares nothing with the viewer's, and reports whether they built.
+it is a check and a driver cache warm-up, not a background compile:
+the worker's program is dropped, the viewer still compiles and links the sources on its own thread,
+and pays for the first draw's code generation there.
+what it saves is the viewer's time on sources that fail, those never reach it,
+and with the driver's disk cache on (_glprogram.enable_disk_cache) part of the compile of good ones.
+'''
+
+import os
+import queue
+import threading
+
+from watchdog.events import FileSystemEventHandler
+
+from _glsource import _shader_source
+
+
+class ReloadCoordinator(FileSystemEventHandler):
+    def __init__(self, callback, window=0.15):
+        '''
+        callback(paths): called from a timer thread with the changed paths of a burst
+        '''
+
+        self.callback = callback
+        self.window = window
+
+        self._roots = set()
+        self._pending = set()
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def follow(self, *paths):
+        ''' react to changes of these shaders and of everything they include '''
+        with self._lock:
+            self._roots.update(os.path.abspath(path) for path in paths)
+
+    def unfollow(self, *paths):
+        with self._lock:
+            self._roots.difference_update(os.path.abspath(path) for path in paths)
+
+    def relevant(self, path):
+        path = os.path.abspath(path)
+        for root in list(self._roots):
+            try:
+                if path in _shader_source().dependencies(root):
+                    return True
+            except OSError:
+                # followed shader deleted or mid-save, only its own path counts
+                if path == root:
+                    return True
+        return False
+
+    def on_any_event(self, event):
+        if event.is_directory:
+            return
+
+        paths = [event.src_path, getattr(event, "dest_path", None)]
+        paths = [path for path in paths if path and self.relevant(path)]
+        if not paths:
+            return
+
+        with self._lock:
+            self._pending.update(paths)
+
+            # every event of the burst pushes the reload back
+            if self._timer:
+                self._timer.cancel()
+            self._timer = threading.Timer(self.window, self._fire)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _fire(self):
+        with self._lock:
+            paths = sorted(self._pending)
+            self._pending = set()
+            self._timer = None
+
+        if paths:
+            self.callback(paths)
+
+
+class ShaderPrecheck(object):
+    def __init__(self, done):
+        '''
+        done(tag, stages, error): called from the worker thread,
+        error is None when the sources compiled and linked
+        '''
+
+        self.done = done
+        self._jobs = queue.Queue()
+        self._latest = {}
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, tag, **stages):
+        '''
+        stages: context.program keywords, or compute_shader
+        only the newest submission of a tag is checked, older ones are skipped
+        '''
+
+        self._latest[tag] = stages
+        self._jobs.put(tag)
+
+    def _run(self):
+        from _context import create_headless_context
+
+        context = create_headless_context(430)
+        while True:
+            tag = self._jobs.get()
+            if tag is None:
+                break
+
+            stages = self._latest.pop(tag, None)
+            if stages is None:
+                continue
+
+            try:
+                if "compute_shader" in stages:
+                    program = context.compute_shader(stages["compute_shader"])
+                else:
+                    program = context.program(**stages)
+                program.release()
+                error = None
+            except Exception as e:
+                error = e
+            self.done(tag, stages, error)
+
+        context.release()
+
+    def close(self):
+        self._jobs.put(None)
+        self._thread.join()
@@ -0,0 +1,195 @@
+'''
+texture to image filters at any resolution
+
+kernels sample the source texture at unit 0 and imageStore into the target at unit 1,
+in 16x16 workgroups with the dispatch computed from the texture size,
+so an image is filtered in one pass up to GL_MAX_TEXTURE_SIZE on either side.
+programs don't depend on the image size, they compile once per context and radius.
+
+    median = MedianImageFilter(context, radius=2)
+    median.run(source_texture, target_texture)
+'''
+
+import os
+
+import numpy as np
+
+from _glsource import _shader_source
+from _glprogram import _program_cache
+from _median import RADII
+from _median import median_network
+
+
+GL = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gl")
+TILE = 16
+
+# moderngl 'f1' is normalized rgba8, 'u1' would be an integer texture
+DTYPES = {
+    np.dtype('float32'): 'f4',
+    np.dtype('float16'): 'f2',
+    np.dtype('uint8'): 'f1',
+}
+
+
+def dispatch_groups(size, tile=TILE):
+    ''' workgroups covering a (width, height) image '''
+    width, height = size
+    return (width + tile - 1) // tile, (height + tile - 1) // tile
+
+
+def texture_from_array(context, image):
+    ''' (height, width, components) float32, float16 or uint8 array, row 0 at the bottom '''
+    image = np.ascontiguousarray(image)
+    if image.dtype not in DTYPES:
+        raise Exception(f"unsupported image dtype {image.dtype}, one of {list(DTYPES.keys())}")
+
+    height, width, components = image.shape
+    return context.texture((width, height), components, image, dtype=DTYPES[image.dtype])
+
+
+def texture_to_array(texture):
+    dtype = {moderngl_dtype: dtype for dtype, moderngl_dtype in DTYPES.items()}[texture.dtype]
+    data = np.frombuffer(texture.read(), dtype=dtype)
+    return data.reshape((texture.height, texture.width, texture.components))
+
+
+class ImageFilter(object):
+    def __init__(self, context, path, defines):
+        self.context = context
+        self.program = _program_cache(context).compute_shader(_shader_source().expand(path, defines))
+
+    def prepare(self):
+        ''' set uniforms before a dispatch, the program may be shared with other filters '''
+        pass
+
+    def run(self, source, target):
+        '''
+        source: texture of any format, sampled at level 0
+        target: texture of the same size, written as an image
+        '''
+
+        if source.size != target.size:
+            raise Exception(f"filter target {target.size} doesn't match source {source.size}")
+
+        self.prepare()
+        source.use(0)
+        target.bind_to_image(1, read=False, write=True)
+        self.program.run(*dispatch_groups(source.size))
+        # imageStore writes aren't visible to sampling, reads or pbo copies without it
+        self.context.memory_barrier()
+
+
+class MedianImageFilter(ImageFilter):
+    def __init__(self, context, radius=2):
+        ''' radius: 1, 2 or 3 for 3x3, 5x5 and 7x7, same selection as _median.MedianFilter '''
+        if radius not in RADII:
+            raise Exception(f"median radius {radius} not supported, one of {RADII}")
+
+        side = 2 * radius + 1
+        network = '\n'.join(f"    CSWAP({a}, {b})" for a, b in median_network(side * side))
+        super(MedianImageFilter, self).__init__(
+            context, os.path.join(GL, "median_image.glsl"), {"RADIUS": radius, "NETWORK": network})
+        self.radius = radius
+
+
+class ConvolutionFilter(ImageFilter):
+    def __init__(self, context, weights):
+        '''
+        weights: (side, side) array with odd side, row 0 at the bottom,
+        applied as a correlation like scipy.ndimage.correlate
+        '''
+
+        weights = np.asarray(weights, dtype='f4')
+        side = weights.shape[0]
+        if weights.shape != (side, side) or side % 2 == 0:
+            raise Exception(f"convolution weights must be square with an odd side, got {weights.shape}")
+
+        super(ConvolutionFilter, self).__init__(
+            context, os.path.join(GL, "convolve_image.glsl"), {"RADIUS": side // 2})
+        self.weights = weights
+
+    def prepare(self):
+        self.program['weights'].value = tuple(self.weights.ravel())
+
+
+def gaussian_weights(radius, sigma=None):
+    sigma = sigma or max(radius / 2.0, 0.5)
+    x = np.arange(-radius, radius + 1, dtype='f8')
+    line = np.exp(-0.5 * (x / sigma) ** 2)
+    weights = np.outer(line, line)
+    return (weights / weights.sum()).astype('f4')
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    from scipy import ndimage
+
+    from _context import create_headless_context
+    from _median import MedianFilter
+    from _median import median_reference
+
+    # python _imagefilter.py [width height ..]
+    sizes = [int(v) for v in sys.argv[1:]]
+    sizes = list(zip(sizes[::2], sizes[1::2])) or [(3840, 2160), (7680, 4320)]
+
+    context = create_headless_context(430)
+
+    # identical to the storage buffer kernels on sizes they handle, odd sizes included
+    for width, height in ((1024, 576), (1000, 563)):
+        image = np.random.uniform(0.0, 1.0, (height, width, 4)).astype('f4')
+        in_buffer = context.buffer(image)
+        out_buffer = context.buffer(reserve=image.nbytes)
+        source = texture_from_array(context, image)
+        target = context.texture((width, height), 4, dtype='f4')
+
+        for radius in RADII:
+            MedianFilter(context, (width, height), radius).run(in_buffer, out_buffer)
+            MedianImageFilter(context, radius).run(source, target)
+            expected = np.frombuffer(out_buffer.read(), dtype='f4').reshape(image.shape)
+            print(
+                f"{width}x{height} median {2 * radius + 1}x{2 * radius + 1}: "
+                f"image == buffer kernel {np.array_equal(texture_to_array(target), expected)}")
+
+        weights = gaussian_weights(3)
+        ConvolutionFilter(context, weights).run(source, target)
+        expected = np.stack(
+            [ndimage.correlate(image[..., c], weights, mode='nearest') for c in range(4)], axis=-1)
+        print(
+            f"{width}x{height} convolution 7x7: matches scipy "
+            f"{np.allclose(texture_to_array(target), expected, atol=1e-5)}")
+
+        for resource in (in_buffer, out_buffer, source, target):
+            resource.release()
+
+    # one pass at any size, checked on the bottom and top strips against the reference
+    for width, height in sizes:
+        image = np.random.randint(0, 256, (height, width, 4), dtype=np.uint8)
+        source = texture_from_array(context, image)
+        target = context.texture((width, height), 4, dtype='f1')
+
+        for radius in RADII:
+            # the first dispatch includes llvmpipe's code generation
+            median = MedianImageFilter(context, radius)
+            median.run(source, target)
+            context.finish()
+            start = time.perf_counter()
+            median.run(source, target)
+            context.finish()
+            seconds = time.perf_counter() - start
+
+            result = texture_to_array(target)
+            strip = 32
+            bottom = median_reference(image[:strip + radius] / np.float32(255.0), radius)[:strip]
+            top = median_reference(image[-strip - radius:] / np.float32(255.0), radius)[-strip:]
+            matches = (
+                np.array_equal(result[:strip], np.round(bottom * 255.0).astype(np.uint8)) and
+                np.array_equal(result[-strip:], np.round(top * 255.0).astype(np.uint8)))
+            print(
+                f"{width}x{height} median {2 * radius + 1}x{2 * radius + 1}: "
+                f"{seconds * 1000.0:9.2f} ms, {dispatch_groups((width, height))} groups, "
+                f"matches reference {matches}")
+
+        source.release()
+        target.release()
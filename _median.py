@@ -0,0 +1,218 @@
+'''
+shared memory median filter, 3x3, 5x5 and 7x7
+
+the window median is picked by a fixed compare-exchange network on uint luminance keys:
+Batcher's odd-even merge sort for the window size, pruned back to the comparators
+the middle element depends on (24 for 3x3, 113 for 5x5, 319 for 7x7).
+the key carries the window index in its low byte, the output is the colour of the median pixel.
+
+median_reference() computes the same keys and the same selection in numpy.
+'''
+
+import os
+import weakref
+
+import numpy as np
+
+from _glsource import _shader_source
+from _glprogram import _program_cache
+
+
+SHADER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gl", "median_shared.glsl")
+TILE = 16
+RADII = (1, 2, 3)
+
+LUMINANCE = np.array([0.2126, 0.7152, 0.0722], dtype=np.float32)
+
+
+def _merge_sort_network(n):
+    ''' Batcher's odd-even merge sort over the next power of two, comparators past n dropped '''
+    size = 1
+    while size < n:
+        size *= 2
+
+    comparators = []
+    p = 1
+    while p < size:
+        k = p
+        while k >= 1:
+            for j in range(k % p, size - k, 2 * k):
+                for i in range(min(k, size - j - k)):
+                    if (i + j) // (2 * p) == (i + j + k) // (2 * p):
+                        comparators.append((i + j, i + j + k))
+            k //= 2
+        p *= 2
+
+    # padding wires hold +inf, they never swap with the real ones
+    return [(a, b) for a, b in comparators if b < n]
+
+
+def median_network(n):
+    ''' comparators (low, high) leaving the median of n values at n // 2 '''
+    needed = {n // 2}
+    network = []
+    for a, b in reversed(_merge_sort_network(n)):
+        if a in needed or b in needed:
+            needed.update((a, b))
+            network.append((a, b))
+    return network[::-1]
+
+
+def median_source(radius, width, height):
+    if radius not in RADII:
+        raise Exception(f"median radius {radius} not supported, one of {RADII}")
+
+    side = 2 * radius + 1
+    network = '\n'.join(f"    CSWAP({a}, {b})" for a, b in median_network(side * side))
+    defines = {
+        "W": width,
+        "H": height,
+        "RADIUS": radius,
+        "NETWORK": network,
+    }
+    return _shader_source().expand(SHADER, defines)
+
+
+class MedianFilter(object):
+    def __init__(self, context, size, radius=2):
+        '''
+        size: (width, height) of the rgba32f images in the storage buffers
+        radius: 1, 2 or 3 for 3x3, 5x5 and 7x7
+        '''
+
+        self.context = context
+        self.size = tuple(size)
+        self.radius = radius
+        self.program = _program_cache(context).compute_shader(median_source(radius, *self.size))
+
+    @property
+    def groups(self):
+        width, height = self.size
+        return (width + TILE - 1) // TILE, (height + TILE - 1) // TILE
+
+    def run(self, in_buffer, out_buffer):
+        ''' in_buffer -> out_buffer, both rows of width vec4, bottom row first '''
+        in_buffer.bind_to_storage_buffer(0)
+        out_buffer.bind_to_storage_buffer(1)
+        self.program.run(*self.groups)
+        # out_buffer is read back or bound as the next pass's input
+        self.context.memory_barrier()
+
+
+_filters = weakref.WeakKeyDictionary()
+
+
+def _median_filter(context, size, radius=2):
+    ''' one MedianFilter per context, size and radius '''
+    filters = _filters.get(context)
+    if filters is None:
+        filters = _filters[context] = {}
+
+    key = (tuple(size), radius)
+    if key not in filters:
+        filters[key] = MedianFilter(context, size, radius)
+    return filters[key]
+
+
+def luminance_keys(image):
+    ''' the shader's 16 bit keys for a (height, width, 4) float32 image '''
+    image = np.asarray(image, dtype=np.float32)
+    luminance = image[..., 0] * LUMINANCE[0] + image[..., 1] * LUMINANCE[1] + image[..., 2] * LUMINANCE[2]
+    return (np.clip(luminance, 0.0, 1.0) * np.float32(65535.0) + np.float32(0.5)).astype(np.uint32)
+
+
+def median_reference(image, radius=2, rows=64):
+    '''
+    (height, width, 4) float32 -> median filtered copy, clamp-to-edge borders
+    same keys and tie break as the shader, rows at a time to bound the window memory
+    '''
+
+    image = np.asarray(image, dtype=np.float32)
+    height, width = image.shape[:2]
+    side = 2 * radius + 1
+
+    padded = np.pad(image, ((radius, radius), (radius, radius), (0, 0)), mode='edge')
+    keys = luminance_keys(padded)
+
+    result = np.empty_like(image)
+    ys, xs = np.mgrid[0:rows, 0:width]
+    for top in range(0, height, rows):
+        count = min(rows, height - top)
+
+        # (count, width, side * side) packed keys, window index in the low byte
+        windows = np.empty((count, width, side * side), dtype=np.uint32)
+        for wy in range(side):
+            for wx in range(side):
+                win_i = wx + wy * side
+                windows[..., win_i] = (keys[top + wy:top + wy + count, wx:wx + width] << 8) | win_i
+
+        median = np.partition(windows, side * side // 2, axis=-1)[..., side * side // 2] & 0xff
+        src_y = ys[:count] + top + median // side
+        src_x = xs[:count] + median % side
+        result[top:top + count] = padded[src_y, src_x]
+    return result
+
+
+def _legacy_source(path, width, height):
+    defines = {"X": width, "Y": 1, "Z": 1, "W": width, "H": height}
+    return _shader_source().expand(path, defines)
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    from scipy import ndimage
+
+    from _context import create_headless_context
+
+    # python _median.py [width height]
+    width, height = (int(v) for v in sys.argv[1:3]) if len(sys.argv) > 2 else (1024, 576)
+    iterations = 5
+
+    context = create_headless_context(430)
+    image = np.random.uniform(0.0, 1.0, (height, width, 4)).astype('f4')
+    in_buffer = context.buffer(image)
+    out_buffer = context.buffer(reserve=image.nbytes)
+
+    def timed(run):
+        run()
+        context.finish()
+        start = time.perf_counter()
+        for _ in range(iterations):
+            run()
+        context.finish()
+        return (time.perf_counter() - start) / iterations
+
+    for radius in RADII:
+        side = 2 * radius + 1
+        median = _median_filter(context, (width, height), radius)
+        seconds = timed(lambda: median.run(in_buffer, out_buffer))
+        result = np.frombuffer(out_buffer.read(), dtype='f4').reshape(image.shape)
+
+        expected = median_reference(image, radius)
+        exact = np.array_equal(result, expected)
+
+        # scipy ranks the scalar keys, only the key of the picked pixel is comparable
+        scipy_keys = ndimage.median_filter(luminance_keys(image), size=side, mode='nearest')
+        keys_match = np.array_equal(luminance_keys(result), scipy_keys)
+
+        print(
+            f"{side}x{side} shared: {seconds * 1000.0:8.2f} ms, "
+            f"{len(median_network(side * side))} comparators, "
+            f"matches reference {exact}, matches scipy keys {keys_match}")
+
+    # the existing kernels run one row per workgroup, width has to fit a workgroup
+    if width <= 1024:
+        for side, path in ((5, "gl/median_5x5.glsl"), (7, "testdrive/testdrive.gl")):
+            path = os.path.join(os.path.dirname(os.path.abspath(__file__)), path)
+            program = context.compute_shader(_legacy_source(path, width, height))
+
+            def legacy():
+                in_buffer.bind_to_storage_buffer(0)
+                out_buffer.bind_to_storage_buffer(1)
+                program.run(height, 1)
+
+            seconds = timed(legacy)
+            print(f"{side}x{side} bubble sort: {seconds * 1000.0:8.2f} ms")
+            program.release()
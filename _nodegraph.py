@@ -0,0 +1,597 @@
+'''
+gpu node graph
+
+nodes are _Loader based shader passes with typed texture ports, a Graph connects them,
+orders them topologically and only runs what changed:
+
+    graph = Graph(context)
+    image = graph.add(ImageNode(context, img))
+    normal = graph.add(DepthToNormalNode(context))
+    blend = graph.add(BlendNode(context))
+    graph.connect(image, "out", normal, "source")
+    graph.connect(normal, "out", blend, "a")
+    graph.connect(image, "out", blend, "b")
+    graph.evaluate()                        runs image, normal and blend
+    graph.evaluate()                        clean, no gl calls at all
+    blend.set("amount", 0.3)                dirties blend and everything below it
+    graph.texture(blend)
+
+a node re-runs when one of its uniforms, its shader source, its image or a node above it changed.
+shader edits are picked up by reload_shaders(), lightshop.GraphWidget calls it for every burst of saves
+a _hotreload.ReloadCoordinator following shader_paths() reports.
+render targets come from the per context TargetPool. outputs of nodes with cache=False go back
+to the pool as soon as their last consumer ran, the next node of the same evaluation reuses them,
+and they're recomputed when something below them needs them again.
+cached outputs (the default) stay, so an edit re-runs only the nodes below the edit.
+'''
+
+import weakref
+from collections import namedtuple
+
+import numpy as np
+
+from _glloader import _Loader
+from _glprogram import _program_cache
+from _glsource import _shader_source
+
+
+# port type, ports connect when components and moderngl dtype match
+TextureType = namedtuple("TextureType", ["components", "dtype"])
+
+
+RGBA8 = TextureType(4, 'f1')
+RGBA16F = TextureType(4, 'f2')
+RGBA32F = TextureType(4, 'f4')
+R32F = TextureType(1, 'f4')
+
+
+class TargetPool(object):
+    '''
+    render target textures of one context by (size, type), released ones are handed out again.
+    framebuffers are cached per set of attachments
+    '''
+
+    def __init__(self, context):
+        self.context = context
+        self._free = {}
+        self._framebuffers = {}
+        self.allocated = 0
+
+    def acquire(self, size, texture_type):
+        free = self._free.get((tuple(size), texture_type))
+        if free:
+            return free.pop()
+
+        self.allocated += 1
+        return self.context.texture(tuple(size), texture_type.components, dtype=texture_type.dtype)
+
+    def release(self, texture):
+        key = (texture.size, TextureType(texture.components, texture.dtype))
+        self._free.setdefault(key, []).append(texture)
+
+    def framebuffer(self, textures):
+        key = tuple(texture.glo for texture in textures)
+        framebuffer = self._framebuffers.get(key)
+        if framebuffer is None:
+            framebuffer = self._framebuffers[key] = self.context.framebuffer(list(textures))
+        return framebuffer
+
+    def trim(self):
+        ''' release the free textures and the framebuffers using them '''
+        free = set()
+        for textures in self._free.values():
+            for texture in textures:
+                free.add(texture.glo)
+                texture.release()
+        self._free = {}
+
+        for key, framebuffer in list(self._framebuffers.items()):
+            if free.intersection(key):
+                framebuffer.release()
+                del self._framebuffers[key]
+
+
+_pools = weakref.WeakKeyDictionary()
+
+
+def _target_pool(context):
+    ''' one TargetPool per context '''
+    pool = _pools.get(context)
+    if pool is None:
+        pool = _pools[context] = TargetPool(context)
+    return pool
+
+
+class Node(_Loader):
+    '''
+    inputs, outputs: {port name: TextureType}
+    size: (width, height) of the outputs, None takes the size of the first connected input
+    cache: keep the outputs between evaluations
+    '''
+
+    inputs = {}
+    outputs = {"out": RGBA8}
+
+    def __init__(self, gl_context, size=None, cache=True):
+        super(Node, self).__init__()
+        self.context = gl_context
+        self.size = size
+        self.cache = cache
+        self.uniforms = {}
+        self.graph = None
+        self.dirty = True
+
+    def set(self, name, value):
+        ''' uniform value, dirties the node only when it changed '''
+        if self.uniforms.get(name) == value:
+            return
+        self.uniforms[name] = value
+        self.mark_dirty()
+
+    def mark_dirty(self):
+        self.dirty = True
+        if self.graph:
+            self.graph.changed()
+
+    def shader_paths(self):
+        return []
+
+    def reload(self):
+        ''' re-read shader sources, True when the node has to run again '''
+        return False
+
+    def execute(self, inputs, targets):
+        '''
+        inputs: {port name: texture} of the connected inputs
+        targets: {port name: texture} to render the outputs into
+        '''
+        raise Exception(f"{type(self).__name__} has no execute")
+
+    def release(self):
+        pass
+
+
+class ImageNode(Node):
+    ''' graph source holding an uploaded image, set_image writes into the same texture '''
+
+    framebuffer = None
+
+    def __init__(self, gl_context, img=None, cache=True):
+        super(ImageNode, self).__init__(gl_context, cache=cache)
+        if img:
+            self.set_image(img)
+
+    def set_image(self, img):
+        data = img.convert("RGBA").tobytes()
+        if self.texture and self.texture.size == img.size:
+            self.texture.write(data)
+        else:
+            self.release()
+            self.texture = self.context.texture(img.size, 4, data)
+            self.framebuffer = self.context.framebuffer([self.texture])
+        self.size = img.size
+        self.mark_dirty()
+
+    def execute(self, inputs, targets):
+        # a copy keeps the output a pooled target like every other one
+        self.context.copy_framebuffer(targets["out"], self.framebuffer)
+
+    def release(self):
+        if self.texture:
+            self.framebuffer.release()
+            self.texture.release()
+        self.framebuffer = None
+        self.texture = None
+
+
+_shader_nodes = weakref.WeakKeyDictionary()
+
+
+def _nodes_of(context):
+    ''' live ShaderNodes per context, the program cache shares a program between nodes of equal sources '''
+    nodes = _shader_nodes.get(context)
+    if nodes is None:
+        nodes = _shader_nodes[context] = weakref.WeakSet()
+    return nodes
+
+
+class ShaderNode(Node):
+    '''
+    fullscreen fragment pass, input ports are sampler2D uniforms of the same name,
+    outputs are the fragment outputs in port order
+    '''
+
+    program = None
+
+    vertex = "./gl/passthrough2d.vert"
+    fragment = None
+
+    def __init__(self, gl_context, size=None, cache=True, fragment=None, defines=None):
+        super(ShaderNode, self).__init__(gl_context, size, cache)
+        self.fragment = fragment or self.fragment
+        self.defines = defines
+        self.sources = None
+        self.vao = None
+        self.reload()
+        _nodes_of(self.context).add(self)
+
+    def shader_paths(self):
+        return [self.vertex, self.fragment]
+
+    def reload(self):
+        source = _shader_source()
+        sources = (
+            source.expand(self.vertex),
+            source.expand(self.fragment, self.defines),
+        )
+        if sources == self.sources:
+            return False
+
+        # a source that fails to compile raises here and leaves the node as it was
+        program = _program_cache(self.context).program(vertex_shader=sources[0], fragment_shader=sources[1])
+        previous = self.program
+        self.program = program
+        self.sources = sources
+        if self.vao is None:
+            self.rebuild_quad(1.0)
+        else:
+            self.vao.release()
+            self.vao = self.context.vertex_array(self.program, self.vbo, self.ibo)
+
+        self._discard(previous)
+        self.mark_dirty()
+        return True
+
+    def _discard(self, program):
+        ''' release program from the cache unless another node still draws with it '''
+        if program is None or program is self.program:
+            return
+        if any(node.program is program for node in _nodes_of(self.context)):
+            return
+        _program_cache(self.context).discard(program)
+
+    def execute(self, inputs, targets):
+        for unit, (name, texture) in enumerate(sorted(inputs.items())):
+            texture.use(location=unit)
+            if name in self.program:
+                self.program[name].value = unit
+
+        for name, value in self.uniforms.items():
+            if name in self.program:
+                self.program[name].value = value
+
+        pool = self.graph.pool if self.graph else _target_pool(self.context)
+        pool.framebuffer([targets[name] for name in self.outputs]).use()
+        self.vao.render()
+
+    def release(self):
+        if self.vao:
+            self.vao.release()
+        self.vao = None
+
+        program, self.program = self.program, None
+        _nodes_of(self.context).discard(self)
+        self._discard(program)
+
+
+class Graph(object):
+    def __init__(self, context, pool=None):
+        self.context = context
+        self.pool = pool or _target_pool(context)
+        self.nodes = []
+        self.links = {}
+        self.on_dirty = None
+
+        self._order = None
+        self._outputs = {}
+        self.executed = []
+
+    def add(self, node):
+        node.graph = self
+        self.nodes.append(node)
+        self._order = None
+        node.mark_dirty()
+        return node
+
+    def remove(self, node):
+        for (target, port), (source, _) in list(self.links.items()):
+            if node in (target, source):
+                self.disconnect(target, port)
+        self._free(node)
+        self.nodes.remove(node)
+        node.graph = None
+        self._order = None
+
+    def connect(self, source, output, target, input):
+        ''' source.output feeds target.input, an input has one link, an output any number '''
+        if output not in source.outputs:
+            raise Exception(f"{type(source).__name__} has no output {output}, one of {sorted(source.outputs)}")
+        if input not in target.inputs:
+            raise Exception(f"{type(target).__name__} has no input {input}, one of {sorted(target.inputs)}")
+        if source.outputs[output] != target.inputs[input]:
+            raise Exception(
+                f"can't connect {type(source).__name__}.{output} {source.outputs[output]} "
+                f"to {type(target).__name__}.{input} {target.inputs[input]}")
+
+        self.links[(target, input)] = (source, output)
+        self._order = None
+        try:
+            self.order()
+        except Exception:
+            del self.links[(target, input)]
+            self._order = None
+            raise
+        target.mark_dirty()
+
+    def disconnect(self, target, input):
+        if self.links.pop((target, input), None):
+            self._order = None
+            target.mark_dirty()
+
+    def changed(self):
+        if self.on_dirty:
+            self.on_dirty()
+
+    def upstream(self, node):
+        return [source for (target, _), (source, _) in self.links.items() if target is node]
+
+    def order(self):
+        ''' nodes sorted so every node comes after its inputs, in insertion order otherwise '''
+        if self._order is not None:
+            return self._order
+
+        pending = {node: len(self.upstream(node)) for node in self.nodes}
+        ready = [node for node in self.nodes if pending[node] == 0]
+        order = []
+        while ready:
+            node = ready.pop(0)
+            order.append(node)
+            for (target, _), (source, _) in self.links.items():
+                if source is node:
+                    pending[target] -= 1
+                    if pending[target] == 0:
+                        ready.append(target)
+
+        if len(order) != len(self.nodes):
+            cycle = [type(node).__name__ for node in self.nodes if node not in order]
+            raise Exception(f"node graph has a cycle through {cycle}")
+
+        self._order = order
+        return order
+
+    def shader_paths(self):
+        ''' shader files of every node, for a _hotreload.ReloadCoordinator to follow '''
+        return sorted(set(path for node in self.nodes for path in node.shader_paths()))
+
+    def reload_shaders(self):
+        '''
+        re-read the shaders of every node, returns the nodes whose source changed,
+        they and the nodes below them run at the next evaluate.
+        a node whose source fails to build keeps its program, the others reload anyway
+        '''
+
+        changed = []
+        for node in self.nodes:
+            try:
+                if node.reload():
+                    changed.append(node)
+            except Exception as e:
+                print(f"failed to reload {type(node).__name__} shaders, {e}")
+        return changed
+
+    def texture(self, node, output="out"):
+        ''' output texture of the last evaluation, None when it wasn't kept '''
+        return self._outputs.get((node, output))
+
+    def _size(self, node):
+        if node.size:
+            return node.size
+        for input in sorted(node.inputs):
+            link = self.links.get((node, input))
+            if link:
+                return self._size(link[0])
+        raise Exception(f"{type(node).__name__} has no size and no connected input")
+
+    def _free(self, node):
+        for output in node.outputs:
+            texture = self._outputs.pop((node, output), None)
+            if texture:
+                self.pool.release(texture)
+
+    def _schedule(self):
+        ''' dirty nodes, everything below them and whatever they need that wasn't kept '''
+        order = self.order()
+        run = set()
+        for node in order:
+            if node.dirty or any(source in run for source in self.upstream(node)):
+                run.add(node)
+
+        pending = list(run)
+        while pending:
+            node = pending.pop()
+            for source in self.upstream(node):
+                if source not in run and any((source, output) not in self._outputs for output in source.outputs):
+                    run.add(source)
+                    pending.append(source)
+
+        return [node for node in order if node in run]
+
+    def evaluate(self):
+        '''
+        run the nodes that changed and everything depending on them,
+        returns the nodes that ran, an idle graph returns [] without touching gl
+        '''
+
+        run = self._schedule()
+        consumers = {node: 0 for node in run}
+        for (target, _), (source, _) in self.links.items():
+            if target in consumers and source in consumers:
+                consumers[source] += 1
+
+        for node in run:
+            inputs = {}
+            for input in node.inputs:
+                link = self.links.get((node, input))
+                if link:
+                    inputs[input] = self._outputs[link]
+
+            # the old outputs go back first, so a rerun usually gets the same textures
+            size = self._size(node)
+            self._free(node)
+            targets = {output: self.pool.acquire(size, kind) for output, kind in node.outputs.items()}
+            node.execute(inputs, targets)
+            for output, texture in targets.items():
+                self._outputs[(node, output)] = texture
+            node.dirty = False
+
+            for source in self.upstream(node):
+                if source in consumers:
+                    consumers[source] -= 1
+                    if consumers[source] == 0 and not source.cache:
+                        self._free(source)
+
+        self.executed = run
+        return run
+
+    def release(self):
+        for node in list(self.nodes):
+            self._free(node)
+            node.release()
+        self.nodes = []
+        self.links = {}
+        self._order = None
+
+
+if __name__ == "__main__":
+    import os
+    import time
+
+    from PIL import Image
+
+    from _context import create_headless_context
+    from nodes2d import BlendNode
+    from nodes2d import DepthToNormal
+    from nodes2d import DepthToNormalNode
+
+    # python _nodegraph.py
+    size = (512, 512)
+    context = create_headless_context(430)
+    img = Image.fromarray(np.random.uniform(0, 255, (*size, 3)).astype(np.uint8))
+    names = {}
+
+    def ran(nodes):
+        return [names[node] for node in nodes]
+
+    # image -> normal x2 -> blend <- image
+    graph = Graph(context)
+    image = graph.add(ImageNode(context, img))
+    first = graph.add(DepthToNormalNode(context))
+    second = graph.add(DepthToNormalNode(context))
+    blend = graph.add(BlendNode(context))
+    names.update({image: "image", first: "normal 1", second: "normal 2", blend: "blend"})
+
+    graph.connect(image, "out", first, "source")
+    graph.connect(first, "out", second, "source")
+    graph.connect(second, "out", blend, "a")
+    graph.connect(image, "out", blend, "b")
+
+    print(f"first evaluation:        {ran(graph.evaluate())}")
+    print(f"idle evaluation:         {ran(graph.evaluate())}")
+    blend.set("amount", 0.3)
+    print(f"blend amount changed:    {ran(graph.evaluate())}")
+    blend.set("amount", 0.3)
+    print(f"same amount again:       {ran(graph.evaluate())}")
+    image.set_image(img)
+    print(f"new image:               {ran(graph.evaluate())}")
+    print(f"unchanged shader reload: {ran(graph.reload_shaders())}")
+
+    # an edited fragment dirties its node, a copy of blend.frag stands in for the edited file
+    import shutil
+    import tempfile
+
+    directory = tempfile.mkdtemp()
+    try:
+        fragment = os.path.join(directory, "blend.frag")
+        shutil.copy("./gl/blend.frag", fragment)
+        edited = graph.add(BlendNode(context))
+        edited.fragment = fragment
+        edited.reload()
+        names[edited] = "edited blend"
+        graph.connect(blend, "out", edited, "a")
+        graph.connect(image, "out", edited, "b")
+        graph.evaluate()
+
+        # the first edit keeps the old program, blend still draws with it, later ones replace the edited node's
+        programs = []
+        for edit in range(3):
+            with open(fragment, 'a') as fp:
+                fp.write(f"\n// edit {edit}\n")
+            reloaded = ran(graph.reload_shaders())
+            programs.append(len(_program_cache(context)._programs))
+        print(f"edited shader reload:    {reloaded}, evaluates {ran(graph.evaluate())}")
+        print(f"programs cached after each edit: {programs}")
+
+        # a broken save is logged, the node keeps drawing with its last good program
+        program = edited.program
+        with open(fragment, 'a') as fp:
+            fp.write("\nbroken\n")
+        print(f"broken shader reload:    {ran(graph.reload_shaders())}, program kept {edited.program is program}")
+        graph.remove(edited)
+        edited.release()
+    finally:
+        shutil.rmtree(directory)
+
+    try:
+        graph.connect(blend, "out", first, "source")
+    except Exception as e:
+        print(f"cycle rejected:          {e}")
+
+    # the same chain drawn by hand with the standalone node
+    device = DepthToNormal(context, img, 1.0)
+    framebuffer = context.simple_framebuffer(size)
+    for _ in range(2):
+        framebuffer.use()
+        device.render()
+        device.texture = context.texture(size, 3, framebuffer.read())
+    expected = np.frombuffer(framebuffer.read(), dtype=np.uint8).reshape(512, 512, 3)
+    result = np.frombuffer(graph.texture(second).read(), dtype=np.uint8).reshape(512, 512, 4)[..., :3]
+    print(f"graph matches the hand drawn chain: {np.array_equal(result, expected)}")
+    graph.release()
+
+    # a chain without caching needs the same few pooled targets however long it is, 3 here
+    for cache in (True, False):
+        pool = TargetPool(context)
+        graph = Graph(context, pool)
+        previous = graph.add(ImageNode(context, img, cache=cache))
+        for _ in range(16):
+            node = graph.add(DepthToNormalNode(context, cache=cache))
+            graph.connect(previous, "out", node, "source")
+            previous = node
+        node.cache = True
+
+        graph.evaluate()
+        context.finish()
+        start = time.perf_counter()
+        run = graph.evaluate() if cache else None
+        idle = time.perf_counter() - start
+
+        node.mark_dirty()
+        start = time.perf_counter()
+        edited = graph.evaluate()
+        context.finish()
+        seconds = time.perf_counter() - start
+
+        for node in graph.nodes:
+            node.mark_dirty()
+        start = time.perf_counter()
+        graph.evaluate()
+        context.finish()
+        full = time.perf_counter() - start
+
+        label = "cached" if cache else "uncached"
+        print(
+            f"17 node chain, {label:8s}: {pool.allocated:2d} targets, "
+            f"full {full * 1000.0:7.2f} ms, last node edited {seconds * 1000.0:7.2f} ms ({len(edited)} nodes)"
+            + (f", idle {idle * 1e6:.1f} us" if cache else ""))
+        graph.release()
+        pool.trim()
@@ -0,0 +1,185 @@
+'''
+iterative filtering without per-pass readback
+
+PingPong chains passes of an _imagefilter filter between two textures on the gpu,
+frames only come back to the cpu on the passes the schedule asks for,
+through an AsyncReadback ring so the copy of pass k overlaps the passes after it.
+
+every pass is wrapped in a GL_TIME_ELAPSED query, the results are collected after the run.
+llvmpipe executes a compute dispatch inside the call and reports ~0 ns for it,
+submit_times holds the cpu side of each pass, which is the whole pass there.
+'''
+
+import time
+from collections import deque
+
+import numpy as np
+
+from _readback import AsyncReadback
+from _imagefilter import DTYPES
+
+
+def readback_schedule(passes, every=None):
+    ''' pass indices to read back: every k-th pass and the last one, or only the last one '''
+    if passes <= 0:
+        return []
+    if not every:
+        return [passes - 1]
+    return sorted(set(range(every - 1, passes, every)) | {passes - 1})
+
+
+class PingPong(object):
+    def __init__(self, context, size, components=4, dtype='f4', depth=3, timer=True):
+        '''
+        size: (width, height) of both textures
+        dtype: moderngl texture dtype, frames come back as the matching numpy dtype
+        depth: readback ring slots, frames in flight before a read blocks
+        '''
+
+        self.context = context
+        self.size = tuple(size)
+        self.timer = timer
+
+        numpy_dtype = {moderngl_dtype: dtype for dtype, moderngl_dtype in DTYPES.items()}[dtype]
+        self.textures = [context.texture(self.size, components, dtype=dtype) for _ in range(2)]
+        self.readback = AsyncReadback(context, self.size, components, numpy_dtype, depth)
+
+        self._current = 0
+        self._queries = []
+        self.gpu_times = []
+        self.submit_times = []
+
+    @property
+    def result(self):
+        ''' texture holding the last pass, or the upload '''
+        return self.textures[self._current]
+
+    def upload(self, image):
+        ''' (height, width, components) array, row 0 at the bottom '''
+        self._current = 0
+        self.textures[0].write(np.ascontiguousarray(image))
+
+    def _query(self, i):
+        while len(self._queries) <= i:
+            self._queries.append(self.context.query(time=True))
+        return self._queries[i]
+
+    def run(self, image_filter, passes, every=None, on_frame=None):
+        '''
+        apply image_filter passes times, starting from the current result,
+        its run(source, target) leaves target visible to sampling and readback,
+        as ImageFilter.run does with its closing memory barrier
+
+        every: read back every k-th pass, None for the last pass only
+        on_frame(i, frame): called for scheduled passes in order, without it nothing is read back.
+            frame is a view into the readback ring, copy it to keep it
+        returns the texture holding the last pass
+        '''
+
+        schedule = set(readback_schedule(passes, every)) if on_frame else set()
+        in_flight = deque()
+
+        self.submit_times = []
+        for i in range(passes):
+            source = self.textures[self._current]
+            target = self.textures[1 - self._current]
+
+            start = time.perf_counter()
+            if self.timer:
+                with self._query(i):
+                    image_filter.run(source, target)
+            else:
+                image_filter.run(source, target)
+            self.submit_times.append(time.perf_counter() - start)
+            self._current = 1 - self._current
+
+            if i in schedule:
+                in_flight.append(i)
+                for frame in self.readback.push(target):
+                    on_frame(in_flight.popleft(), frame)
+
+        for frame in self.readback.flush():
+            on_frame(in_flight.popleft(), frame)
+
+        # waits for the last pass, everything before it is done by then
+        self.gpu_times = [query.elapsed / 1e9 for query in self._queries[:passes]] if self.timer else []
+        return self.result
+
+    def release(self):
+        # moderngl queries have no release, they go with the context
+        for texture in self.textures:
+            texture.release()
+        self.readback.release()
+
+        self.textures = []
+        self._queries = []
+
+
+def _sync_readback(context, image_filter, image, passes):
+    ''' the loop this replaces: every pass read back and converted '''
+    from _imagefilter import texture_from_array
+
+    textures = [texture_from_array(context, image), context.texture(image.shape[1::-1], 4, dtype='f4')]
+    for i in range(passes):
+        image_filter.run(textures[i % 2], textures[1 - i % 2])
+        data = np.frombuffer(textures[1 - i % 2].read(), dtype='f4').reshape(image.shape)
+        np.multiply(data, 255).astype(np.uint8)
+
+    for texture in textures:
+        texture.release()
+
+
+if __name__ == "__main__":
+    import sys
+
+    from _context import create_headless_context
+    from _imagefilter import MedianImageFilter
+
+    # python _pingpong.py [passes]
+    passes = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    width, height = 1280, 720
+
+    context = create_headless_context(430)
+    median = MedianImageFilter(context, radius=1)
+    image = np.random.uniform(0.0, 1.0, (height, width, 4)).astype('f4')
+
+    runner = PingPong(context, (width, height))
+    runner.upload(image)
+    runner.run(median, 1)
+
+    start = time.perf_counter()
+    _sync_readback(context, median, image, passes)
+    print(f"readback every pass:      {time.perf_counter() - start:7.3f} s")
+
+    frames = []
+    for every in (10, None):
+        runner.upload(image)
+        start = time.perf_counter()
+        result = runner.run(
+            median, passes, every,
+            on_frame=lambda i, frame: frames.append((i, np.multiply(frame, 255).astype(np.uint8))))
+        label = f"every {every}th pass" if every else "last pass only"
+        print(
+            f"readback {label + ':':16s} {time.perf_counter() - start:7.3f} s, "
+            f"passes read {[i for i, _ in frames]}")
+        frames = []
+
+    # what every skipped readback saves
+    start = time.perf_counter()
+    for _ in range(10):
+        data = np.frombuffer(runner.result.read(), dtype='f4').reshape(image.shape)
+        np.multiply(data, 255).astype(np.uint8)
+    readback = (time.perf_counter() - start) / 10
+
+    print(
+        f"per pass: readback + convert {readback * 1000.0:.3f} ms, gpu query {np.mean(runner.gpu_times) * 1000.0:.3f} ms, "
+        f"submit {np.mean(runner.submit_times) * 1000.0:.3f} ms")
+
+    # same chain as the textures alone
+    runner.upload(image)
+    expected = np.frombuffer(runner.run(median, 3).read(), dtype='f4')
+    runner.upload(image)
+    kept = []
+    runner.run(median, 3, 1, on_frame=lambda i, frame: kept.append(frame.copy()))
+    print(f"scheduled frames match the chain: {np.array_equal(kept[-1].ravel(), expected)}")
+    runner.release()
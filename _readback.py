@@ -0,0 +1,231 @@
+'''
+asynchronous texture readback through a ring of pixel pack buffers
+
+frame k is copied into a pack buffer right after it is rendered
+and only mapped once frame k + depth is pushed, or earlier when its fence signaled.
+'''
+
+import os
+import sys
+import time
+from collections import deque
+
+import numpy as np
+
+from _glsource import _shader_source
+from _glsync import Fence
+from _glsync import fences_supported
+
+
+GL = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gl")
+
+
+# output format: (moderngl texture dtype, numpy readback dtype)
+OUTPUT_FORMATS = {
+    "rgba8": ("f1", np.uint8),
+    "rgba32f": ("f4", np.float32),
+}
+
+
+class FrameResolver(object):
+    '''
+    quantise a float render target to RGBA8 and flip it vertically on gpu,
+    so readback is a single uint8 buffer already in image row order.
+    values truncate through gl/lib/unorm8.glsl, the bytes match _common._flatten_array
+
+    resolve() samples from texture unit 0 and leaves its own framebuffer bound
+    '''
+
+    vertex_shader = """
+    #version 330
+    in vec2 in_vert;
+    void main()
+    {
+        gl_Position = vec4(in_vert, 0.0, 1.0);
+    }
+    """
+
+    def __init__(self, context, size):
+        self.context = context
+        self.program = context.program(
+            vertex_shader=self.vertex_shader,
+            fragment_shader=_shader_source().expand(os.path.join(GL, "resolve_unorm8.frag")))
+
+        verts = np.array([-1.0, -1.0, 1.0, -1.0, -1.0, 1.0, 1.0, 1.0]).astype('f4')
+        self.vao = context.simple_vertex_array(
+            self.program, context.buffer(verts.tobytes()), 'in_vert')
+
+        self.texture = context.texture(size, 4)
+        self.texture.filter = (context.NEAREST, context.NEAREST)
+        self.framebuffer = context.framebuffer([self.texture])
+
+    def resolve(self, texture):
+        self.framebuffer.use()
+        texture.use(0)
+        self.vao.render(mode=self.context.TRIANGLE_STRIP)
+        return self.texture
+
+    def release(self):
+        for resource in (self.vao, self.program, self.framebuffer, self.texture):
+            resource.release()
+
+
+class AsyncReadback(object):
+    def __init__(self, context, size, components=4, dtype='u1', depth=3):
+        self.context = context
+        self.size = size
+        self.shape = (size[1], size[0], components)
+
+        self.buffers = []
+        self.frames = []
+        for _ in range(depth):
+            frame = np.empty(self.shape, dtype=dtype)
+            self.frames.append(frame)
+            self.buffers.append(context.buffer(reserve=frame.nbytes))
+
+        self._slot = 0
+        self._pending = deque()
+
+    def _pop(self):
+        slot, fence = self._pending.popleft()
+        fence.wait()
+        self.buffers[slot].read_into(self.frames[slot])
+        return self.frames[slot]
+
+    def push(self, texture):
+        '''
+        start reading texture, returns frames that became ready, oldest first
+
+        returned arrays are views into the ring,
+        they are overwritten once their slot is pushed again
+        '''
+
+        ready = []
+        if len(self._pending) == len(self.buffers):
+            ready.append(self._pop())
+
+        texture.read_into(self.buffers[self._slot])
+        self._pending.append((self._slot, Fence(self.context)))
+        self._slot = (self._slot + 1) % len(self.buffers)
+
+        ready.extend(self.poll())
+        return ready
+
+    def poll(self):
+        ''' frames already finished on gpu, never blocks '''
+
+        # without real fences mapping early would stall, wait for the ring to fill
+        if not fences_supported():
+            return []
+
+        ready = []
+        while self._pending and self._pending[0][1].signaled():
+            ready.append(self._pop())
+        return ready
+
+    def flush(self):
+        ''' blocking, yields every frame still in flight '''
+        while self._pending:
+            yield self._pop()
+
+    def release(self):
+        for _, fence in self._pending:
+            fence.release()
+        for buffer in self.buffers:
+            buffer.release()
+
+        self._pending.clear()
+        self.buffers = []
+
+
+def _benchmark(context, size, frames=120, depth=3):
+    from _common import _flatten_array
+
+    vs = """
+    #version 330
+    in vec2 in_vert;
+    out vec2 v_uv;
+    void main()
+    {
+        v_uv = in_vert * 0.5 + 0.5;
+        gl_Position = vec4(in_vert, 0.0, 1.0);
+    }
+    """
+    fs = """
+    #version 330
+    uniform float T;
+    in vec2 v_uv;
+    out vec4 out_color;
+    void main()
+    {
+        out_color = vec4(v_uv, sin(T + v_uv.x * 40.0) * 0.5 + 0.5, 1.0);
+    }
+    """
+    program = context.program(vertex_shader=vs, fragment_shader=fs)
+    verts = np.array([-1.0, -1.0, 1.0, -1.0, -1.0, 1.0, 1.0, 1.0]).astype('f4')
+    vao = context.simple_vertex_array(program, context.buffer(verts.tobytes()), 'in_vert')
+
+    texture = context.texture(size, 4, dtype='f4')
+    framebuffer = context.framebuffer([texture])
+    framebuffer.use()
+
+    def render(i):
+        program['T'].value = i * 0.1
+        vao.render(mode=context.TRIANGLE_STRIP)
+
+    start = time.perf_counter()
+    for i in range(frames):
+        render(i)
+        data = np.frombuffer(texture.read(), dtype='f4')
+        _flatten_array(data.reshape((size[1], size[0], 4)))
+    sync_fps = frames / (time.perf_counter() - start)
+
+    readback = AsyncReadback(context, size, dtype='f4', depth=depth)
+    start = time.perf_counter()
+    for i in range(frames):
+        render(i)
+        for data in readback.push(texture):
+            _flatten_array(data)
+    for data in readback.flush():
+        _flatten_array(data)
+    async_fps = frames / (time.perf_counter() - start)
+
+    readback.release()
+    framebuffer.release()
+    texture.release()
+
+    # RGBA8 target, uint8 readback with no cpu conversion
+    texture = context.texture(size, 4)
+    framebuffer = context.framebuffer([texture])
+    framebuffer.use()
+
+    readback = AsyncReadback(context, size, depth=depth)
+    start = time.perf_counter()
+    for i in range(frames):
+        render(i)
+        for data in readback.push(texture):
+            data[::-1]
+    for data in readback.flush():
+        data[::-1]
+    rgba8_fps = frames / (time.perf_counter() - start)
+
+    readback.release()
+    framebuffer.release()
+    texture.release()
+    return sync_fps, async_fps, rgba8_fps
+
+
+if __name__ == "__main__":
+    import moderngl as mg
+
+    # python _readback.py [egl]
+    backend = {"backend": sys.argv[1]} if len(sys.argv) > 1 else {}
+    context = mg.create_standalone_context(**backend)
+    print(context.info["GL_RENDERER"], "fences:", fences_supported())
+
+    for size in ((512, 512), (1280, 720), (1920, 1080)):
+        sync_fps, async_fps, rgba8_fps = _benchmark(context, size)
+        print(
+            f"{size[0]:4}x{size[1]:<4}  sync: {sync_fps:7.2f} fps  "
+            f"async: {async_fps:7.2f} fps  x{async_fps / sync_fps:.2f}  "
+            f"async rgba8: {rgba8_fps:7.2f} fps  x{rgba8_fps / sync_fps:.2f}")
@@ -0,0 +1,75 @@
+'''
+fixed timestep simulation scheduler
+
+simulation time is accumulated from wall clock and consumed in fixed steps,
+a batch of substeps is only submitted after the previous one signaled its fence.
+'''
+
+import time
+
+from _glsync import Fence
+
+
+class RateCounter(object):
+    ''' events per second, averaged over a window in seconds '''
+
+    def __init__(self, window=0.5):
+        self.window = window
+        self.rate = 0.0
+        self._count = 0
+        self._start = time.perf_counter()
+
+    def tick(self, n=1):
+        self._count += n
+        now = time.perf_counter()
+        elapsed = now - self._start
+        if elapsed >= self.window:
+            self.rate = self._count / elapsed
+            self._count = 0
+            self._start = now
+        return self.rate
+
+
+class SimulationScheduler(object):
+    def __init__(self, context, step, hz=60.0, max_substeps=8):
+        self.context = context
+        self.step = step
+        self.timestep = 1.0 / hz
+        self.max_substeps = max_substeps
+
+        self.accumulator = 0.0
+        self.fence = None
+        self.counter = RateCounter()
+        self._previous = time.perf_counter()
+
+    @property
+    def hz(self):
+        ''' measured simulation steps per second '''
+        return self.counter.rate
+
+    def advance(self):
+        '''
+        call once per rendered frame, returns number of substeps submitted
+        '''
+
+        now = time.perf_counter()
+        self.accumulator += now - self._previous
+        self._previous = now
+
+        # don't let a slow gpu build up unbounded debt
+        self.accumulator = min(self.accumulator, self.timestep * self.max_substeps)
+
+        # previous batch still running, keep accumulating
+        if self.fence and not self.fence.signaled():
+            self.counter.tick(0)
+            return 0
+
+        substeps = int(self.accumulator / self.timestep)
+        for _ in range(substeps):
+            self.step()
+        self.accumulator -= substeps * self.timestep
+
+        if substeps:
+            self.fence = Fence(self.context)
+        self.counter.tick(substeps)
+        return substeps
@@ -0,0 +1,381 @@
+'''
+numpy sphere tracer for sample_world style sdf scenes
+
+primitives mirror the glsl ones, points are (n, 3) float32 arrays, distances (n,):
+
+    sphere(p, r)  box(p, b)  cylinder(p, c)  capsule(p, a, b, r)
+    blend(a, b, k)  tile(p, t)  rotate(p, r)
+
+SphereTracer marches all rays of a chunk at once and compacts the working set every step:
+rays that converged or left the scene are written out and dropped, so late steps only
+evaluate the few rays still grazing a surface.
+chunks hold at most budget bytes of per-ray temporaries, tiles of an image can be
+rendered in a process pool.
+
+render() returns float32 rgb with row 0 at the bottom like a gl texture,
+to_image() turns it into uint8 rgba with the top row first, like _flatten_array.
+'''
+
+import time
+import multiprocessing as mp
+
+import numpy as np
+
+
+# dots are spelled out per component, blas and einsum kernels round differently
+# depending on the batch size and a chunked render wouldn't match a whole one
+
+def _dot(v, w):
+    ''' (n, 3) . (n, 3) or (3,) '''
+    w = w.T if w.ndim == 2 else w[:, None]
+    return v[:, 0] * w[0] + v[:, 1] * w[1] + v[:, 2] * w[2]
+
+
+def _length(v):
+    return np.sqrt(_dot(v, v))
+
+
+def sphere(p, r):
+    return _length(p) - np.float32(r)
+
+
+def box(p, b):
+    return _length(np.maximum(np.abs(p) - np.float32(b), 0.0))
+
+
+def cylinder(p, c):
+    ''' infinite along y, c: x and z offset, radius '''
+    dx = p[:, 0] - np.float32(c[0])
+    dz = p[:, 2] - np.float32(c[1])
+    return np.sqrt(dx * dx + dz * dz) - np.float32(c[2])
+
+
+def capsule(p, a, b, r):
+    a = np.float32(a)
+    db = np.float32(b) - a
+    dp = p - a
+    h = np.clip(_dot(dp, db) / np.float32(np.dot(db, db)), 0.0, 1.0)
+    return _length(dp - db * h[:, None]) - np.float32(r)
+
+
+def blend(a, b, k):
+    ''' polynomial smooth minimum '''
+    k = np.float32(k)
+    h = np.clip(0.5 + 0.5 * (a - b) / k, 0.0, 1.0)
+    return a * (1.0 - h) + b * h - k * h * (1.0 - h)
+
+
+def tile(p, t):
+    ''' repeat space every t, like glsl mod(p, t) - 0.5 * t '''
+    t = np.float32(t)
+    return p - t * np.floor(p / t) - 0.5 * t
+
+
+def rotation(r):
+    ''' rz * ry * rx of euler angles r, the matrix glsl rotate() builds '''
+    c, s = np.cos(r), np.sin(r)
+    rx = np.array([[1, 0, 0], [0, c[0], -s[0]], [0, s[0], c[0]]])
+    ry = np.array([[c[1], 0, s[1]], [0, 1, 0], [-s[1], 0, c[1]]])
+    rz = np.array([[c[2], -s[2], 0], [s[2], c[2], 0], [0, 0, 1]])
+
+    # glsl mat3 constructors fill columns, the rows above are their transposes
+    return (rz.T @ ry.T @ rx.T).astype('f4')
+
+
+def rotate(p, r):
+    m = rotation(np.asarray(r, dtype='f8'))
+    return p[:, 0:1] * m[:, 0] + p[:, 1:2] * m[:, 1] + p[:, 2:3] * m[:, 2]
+
+
+def _normalize(v):
+    return v / _length(v)[:, None]
+
+
+class Scene(object):
+    '''
+    sample_world(p) -> distances, shade(p, normal, ray) -> (n, 3) rgb of hits
+    camera at origin looking down +z, uv = (pixel + pixel_center) / size
+    '''
+
+    origin = (0.0, 0.0, -5.0)
+    focal = 1.0001
+    pixel_center = 0.0
+    background = (0.0, 0.0, 0.0)
+
+    steps = 128
+    epsilon = 0.002
+    far = 50.0
+    normal_offset = 0.001
+
+    def sample_world(self, p):
+        raise Exception(f"{type(self).__name__} has no sample_world")
+
+    def shade(self, p, normal, ray):
+        return np.ones_like(p)
+
+    def finish(self, rgb, travel, hit):
+        ''' whole chunk after shading, e.g. fog, rgb (n, 3) '''
+        return rgb
+
+
+class TexgenScene(Scene):
+    ''' gl/tex_gen/sdf_raymarch.glsl '''
+
+    def sample_world(self, p):
+        ds = sphere(p - np.float32([0.5, 0.0, -0.6]), 0.75)
+        db = box(p - np.float32([-0.5, 0.0, 0.0]), 0.35)
+        return blend(ds, db, 0.5)
+
+    def shade(self, p, normal, ray):
+        light = _normalize(np.float32([[-3.0, 3.0, 1.0]]))[0]
+        half_vl = _normalize((-np.float32(self.origin) + light)[None])[0]
+
+        ndh = np.maximum(_dot(normal, -half_vl), 0.0)
+        diffuse = _dot(normal, -light)
+        spec = np.clip(ndh ** 128.0, 0.0, 1.0)
+        return np.repeat((diffuse + spec)[:, None], 3, axis=1)
+
+    def finish(self, rgb, travel, hit):
+        return np.clip(rgb, 0.0, 1.0)
+
+
+class BoxesScene(Scene):
+    '''
+    world of testdrive_moderngl_raymarching.py at time t:
+    three rotating boxes smoothly blended with a sphere, lit and fogged like the shader.
+    the shader itself returns a plain sphere before reaching this world
+    '''
+
+    origin = (0.0, 0.5, -6.0)
+    focal = 1.001
+    pixel_center = 0.5
+    epsilon = 0.000001
+    far = 80.0
+
+    def __init__(self, t=0.0):
+        self.t = t
+
+    def sample_world(self, p):
+        t = self.t
+        left = box(rotate(p - np.float32([-0.8, -0.25, 0.0]), (t, 0.0, 0.0)), 0.4)
+        right = box(rotate(p - np.float32([+0.8, -0.25, 0.0]), (0.0, 0.0, t)), 0.4)
+        up = box(rotate(p - np.float32([0.0, 1.05, 0.0]), (0.0, t, 0.0)), 0.4)
+        boxes = np.minimum(np.minimum(left, right), up)
+
+        return blend(sphere(p - np.float32([0.0, 0.2, 0.0]), 0.65), boxes, 0.3)
+
+    def shade(self, p, normal, ray):
+        origin = np.float32(self.origin)
+        light = _normalize(np.float32([[-0.5, -0.2, -10.0]]))[0]
+
+        lambert = np.clip(_dot(normal, light), 0.1, 1.0)
+        h = _normalize((origin + light)[None])[0]
+        ndh = np.clip(_dot(normal, h), 0.0, 1.0)
+        ndv = np.clip(_dot(normal, -origin), 0.0, 1.0)
+        spec = (ndh + ndv + 0.01) ** 64.0 * 0.25
+
+        albedo = np.float32([0.5, 0.75, 0.25])
+        return albedo * lambert[:, None] + np.float32([0.85, 0.75, 0.5]) * spec[:, None]
+
+    def finish(self, rgb, travel, hit):
+        background = np.float32(0.001 * np.sin(self.t) + 0.0005)
+        rgb = np.where(hit[:, None], rgb, background)
+
+        distance = np.where(hit, travel, np.float32(self.far))
+        fog = np.clip((2.5 / np.abs(distance)) ** 0.32, 0.0, 1.0)[:, None]
+        return np.float32([0.35, 0.37, 0.42]) * (1.0 - fog) + rgb * fog
+
+
+SCENES = {
+    "texgen": TexgenScene,
+    "boxes": BoxesScene,
+}
+
+
+class SphereTracer(object):
+    # peak bytes per ray of march state, sample_world temporaries and shading,
+    # ~100 measured for the scenes here, headroom for bigger worlds
+    BYTES_PER_RAY = 256
+
+    def __init__(self, scene, budget=64 << 20, compact=True):
+        '''
+        budget: bytes of per-ray working memory, rays are traced in chunks that fit it
+        compact: drop finished rays from the working set every step
+        '''
+
+        self.scene = scene
+        self.budget = budget
+        self.compact = compact
+
+        self.evaluations = 0
+
+    @property
+    def chunk(self):
+        return max(self.budget // self.BYTES_PER_RAY, 1)
+
+    def march(self, origin, rays):
+        ''' (n, 3) normalized rays from one origin -> travel (n,), hit (n,) '''
+        scene = self.scene
+        origin = np.float32(origin)
+
+        travel = np.full(len(rays), np.float32(scene.far), dtype='f4')
+        hit = np.zeros(len(rays), dtype=bool)
+
+        index = np.arange(len(rays))
+        ray = rays
+        t = np.zeros(len(rays), dtype='f4')
+        for _ in range(scene.steps):
+            if not len(index):
+                break
+
+            distance = scene.sample_world(origin + ray * t[:, None])
+            self.evaluations += len(index)
+
+            converged = np.abs(distance) < scene.epsilon
+            travel[index[converged]] = t[converged]
+            hit[index[converged]] = True
+
+            if not self.compact:
+                # the whole set keeps marching, finished rays hold still
+                t = np.where(hit | (t >= scene.far), t, t + distance)
+                continue
+
+            t = t + distance
+
+            # a ray past far can't come back to a hit that counts
+            keep = ~converged & (t < scene.far)
+            if not keep.all():
+                index, ray, t = index[keep], ray[keep], t[keep]
+
+        return travel, hit
+
+    def normals(self, p):
+        sample_world = self.scene.sample_world
+        offset = np.float32(self.scene.normal_offset)
+
+        normal = np.empty_like(p)
+        for axis in range(3):
+            o = np.zeros(3, dtype='f4')
+            o[axis] = offset
+            normal[:, axis] = sample_world(p + o) - sample_world(p - o)
+        return _normalize(normal)
+
+    def _rays(self, width, height, rect):
+        x0, y0, x1, y1 = rect
+        ys, xs = np.mgrid[y0:y1, x0:x1].astype('f4') + np.float32(self.scene.pixel_center)
+        uv = np.stack([xs / np.float32(width), ys / np.float32(height)], axis=-1).reshape(-1, 2)
+
+        rays = np.empty((len(uv), 3), dtype='f4')
+        rays[:, :2] = uv - np.float32(0.5)
+        rays[:, 2] = self.scene.focal
+        return _normalize(rays)
+
+    def trace(self, rays):
+        ''' (n, 3) rays -> (n, 3) float32 rgb, chunks of at most budget bytes '''
+        scene = self.scene
+        origin = np.float32(scene.origin)
+
+        rgb = np.empty((len(rays), 3), dtype='f4')
+        for start in range(0, len(rays), self.chunk):
+            chunk = rays[start:start + self.chunk]
+            travel, hit = self.march(origin, chunk)
+
+            colors = np.empty((len(chunk), 3), dtype='f4')
+            colors[:] = np.float32(scene.background)
+            if hit.any():
+                p = origin + chunk[hit] * travel[hit, None]
+                colors[hit] = scene.shade(p, self.normals(p), chunk[hit])
+            rgb[start:start + len(chunk)] = scene.finish(colors, travel, hit)
+        return rgb
+
+    def render_rect(self, width, height, rect):
+        ''' (y1 - y0, x1 - x0, 3) rgb of pixels x0..x1, y0..y1, row 0 at the bottom '''
+        x0, y0, x1, y1 = rect
+        return self.trace(self._rays(width, height, rect)).reshape(y1 - y0, x1 - x0, 3)
+
+    def render(self, width, height, workers=1, tile=128):
+        ''' whole image, tiles spread over a spawn process pool when workers > 1 '''
+        if workers <= 1:
+            return self.render_rect(width, height, (0, 0, width, height))
+
+        rects = split_rects(width, height, tile)
+        jobs = [(self.scene, self.budget, self.compact, width, height, rect) for rect in rects]
+
+        rgb = np.empty((height, width, 3), dtype='f4')
+        with mp.get_context("spawn").Pool(workers) as pool:
+            for (x0, y0, x1, y1), block in zip(rects, pool.imap(_render_tile, jobs)):
+                rgb[y0:y1, x0:x1] = block
+        return rgb
+
+
+def _render_tile(job):
+    scene, budget, compact, width, height, rect = job
+    return SphereTracer(scene, budget, compact).render_rect(width, height, rect)
+
+
+def split_rects(width, height, tile):
+    ''' (x0, y0, x1, y1) tiles of at most tile x tile pixels, bottom row of tiles first '''
+    return [
+        (x, y, min(x + tile, width), min(y + tile, height))
+        for y in range(0, height, tile)
+        for x in range(0, width, tile)
+    ]
+
+
+def to_image(rgb):
+    ''' float rgb, row 0 at the bottom -> uint8 rgba, top row first '''
+    height, width = rgb.shape[:2]
+    data = np.empty((height, width, 4), dtype=np.uint8)
+    data[..., :3] = (np.clip(rgb, 0.0, 1.0) * np.float32(255.99))[::-1]
+    data[..., 3] = 255
+    return data
+
+
+if __name__ == "__main__":
+    import sys
+
+    # python _sdf.py [width height] [--workers n]
+    args = sys.argv[1:]
+    workers = 2
+    if "--workers" in args:
+        i = args.index("--workers")
+        workers = int(args[i + 1])
+        del args[i:i + 2]
+    width, height = (int(v) for v in args[:2]) if len(args) > 1 else (256, 256)
+
+    for name in ("texgen", "boxes"):
+        images = {}
+        for compact in (False, True):
+            tracer = SphereTracer(SCENES[name](), compact=compact)
+            start = time.perf_counter()
+            images[compact] = tracer.render(width, height)
+            seconds = time.perf_counter() - start
+            print(
+                f"{name:7s} {'compacted' if compact else 'full set':9s} {seconds:7.3f} s, "
+                f"{tracer.evaluations / (width * height):6.1f} sample_world per pixel")
+        print(f"{name:7s} compaction changes nothing: {np.array_equal(images[False], images[True])}")
+
+        # small budget, many chunks
+        tracer = SphereTracer(SCENES[name](), budget=1 << 20)
+        chunked = tracer.render(width, height)
+        print(f"{name:7s} {tracer.chunk} ray chunks identical: {np.array_equal(chunked, images[True])}")
+
+        start = time.perf_counter()
+        tiled = SphereTracer(SCENES[name]()).render(width, height, workers=workers, tile=64)
+        print(
+            f"{name:7s} {workers} process tiles {time.perf_counter() - start:7.3f} s, "
+            f"identical: {np.array_equal(tiled, images[True])}")
+
+    # pixel diff against the gl kernel of the same scene
+    try:
+        from _texgen import _texgen_backend
+
+        golden = _texgen_backend("gl").raymarch(width, height)
+    except Exception as e:
+        print(f"no gl reference: {e}")
+    else:
+        preview = to_image(SphereTracer(TexgenScene()).render(width, height))
+        difference = np.abs(preview.astype(int) - golden.astype(int))
+        print(
+            f"texgen vs gl: largest difference {difference.max()}, "
+            f"{np.mean(difference <= 2) * 100.0:.3f}% within 2")
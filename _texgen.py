@@ -0,0 +1,357 @@
+'''
+texture generation backends
+
+the same ops run on a GL 4.3 compute context or in numpy:
+
+    median(image, radius)          (height, width, 4) float32 -> float32, rows as given
+    raymarch(width, height)        sdf scene of gl/tex_gen/sdf_raymarch.glsl
+    screentone(width, height)
+    gradient(width, height, seed)
+
+generators return (height, width, 4) uint8 with the top row first, like _flatten_array.
+_texgen_backend() picks gl when a context with compute shaders can be created, numpy otherwise,
+TEXGEN_BACKEND=gl|numpy forces one.
+
+numpy ops run in row bands, median and raymarch spread the bands over a thread pool,
+the heavy numpy calls release the gil. the raymarch is _sdf's sphere tracer.
+'''
+
+import os
+import time
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from _median import RADII
+from _median import median_reference
+from _sdf import SphereTracer
+from _sdf import TexgenScene
+from _sdf import to_image
+
+
+GL = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gl")
+OPS = ("median", "raymarch", "screentone", "gradient")
+
+
+def gradient_palettes(seed=None):
+    ''' 10 grey stops, 0.1 apart with a random offset, black and white at the ends '''
+    rng = random.Random(seed)
+
+    palettes = []
+    for i in range(10):
+        v = i * 0.1 + rng.random() * 0.1
+        palettes.append((v, v, v))
+
+    palettes[0] = (0.0, 0.0, 0.0)
+    palettes[9] = (1.0, 1.0, 1.0)
+    return palettes
+
+
+def _gradient_last_row(height):
+    ''' last row with y / height < 0.9, the rows above it repeat it '''
+    return int(np.flatnonzero(np.arange(height) / height < 0.9)[-1])
+
+
+def vertical_gradient(width, height, seed=None):
+    palettes = np.array(gradient_palettes(seed), dtype='f8')
+
+    # rows at 0.9 and above match no segment, they keep the last colour below 0.9
+    hr = np.arange(min(height, _gradient_last_row(height) + 1)) / height
+    hr = np.concatenate([hr, np.full(height - len(hr), hr[-1])])
+
+    # palette segment of each row, the first stop above hr
+    stops = np.array([i * 0.1 for i in range(1, 10)])
+    segment = np.searchsorted(stops, hr, side='right') + 1
+
+    # float64 operations in the order of the per pixel loop, so the bytes match it
+    w = ((hr - ((segment - 1) * 0.1)) / 0.1)[:, None]
+    rgb = palettes[segment - 1] * (1.0 - w) + palettes[segment] * w
+
+    rows = np.empty((height, 4), dtype=np.uint8)
+    rows[:, :3] = rgb * 255.99
+    rows[:, 3] = 255
+
+    # one uint32 per pixel fills rows far faster than 4 byte wide broadcasts
+    data = np.empty((height, width, 4), dtype=np.uint8)
+    data.view(np.uint32)[..., 0] = rows[::-1].copy().view(np.uint32)
+    return data
+
+
+def screentone(width, height):
+    # black where row and column agree mod 4, a diagonal line every 4 pixels
+    # only 4 distinct rows, the image is those rows picked by row index
+    patterns = np.empty((4, width, 4), dtype=np.uint8)
+    patterns[..., :3] = np.where(np.arange(4)[:, None] == np.arange(width)[None, :] % 4, 0, 255)[..., None]
+    patterns[..., 3] = 255
+    return patterns[np.arange(height)[::-1] % 4]
+
+
+class Backend(object):
+    name = None
+
+    # seconds of each pass of the last median_passes, gpu_times only where timer queries ran
+    pass_times = []
+    gpu_times = []
+
+    def median(self, image, radius=2):
+        raise Exception(f"{self.name} backend has no median")
+
+    def raymarch(self, width, height):
+        raise Exception(f"{self.name} backend has no raymarch")
+
+    def screentone(self, width, height):
+        raise Exception(f"{self.name} backend has no screentone")
+
+    def gradient(self, width, height, seed=None):
+        raise Exception(f"{self.name} backend has no gradient")
+
+    def median_passes(self, image, radius, passes, every=None, on_frame=None):
+        '''
+        median applied passes times, on_frame(i, frame) on every k-th pass and the last
+        frames are only valid during the call, returns the last pass
+        '''
+
+        from _pingpong import readback_schedule
+
+        schedule = set(readback_schedule(passes, every)) if on_frame else set()
+        self.pass_times = []
+        for i in range(passes):
+            start = time.perf_counter()
+            image = self.median(image, radius)
+            self.pass_times.append(time.perf_counter() - start)
+            if i in schedule:
+                on_frame(i, image)
+        return image
+
+    def release(self):
+        pass
+
+
+class NumpyBackend(Backend):
+    name = "numpy"
+
+    def __init__(self, threads=None, band=64):
+        '''
+        threads: row bands computed at once, cpu count by default
+        band: rows per band, bounds the temporaries of median windows and ray batches
+        '''
+
+        self.band = band
+        self.pool = ThreadPoolExecutor(threads or os.cpu_count() or 1)
+
+    def _bands(self, height, run):
+        ''' run(top, bottom) for every band in the pool, results in row order '''
+        tops = range(0, height, self.band)
+        return list(self.pool.map(lambda top: run(top, min(top + self.band, height)), tops))
+
+    def median(self, image, radius=2):
+        if radius not in RADII:
+            raise Exception(f"median radius {radius} not supported, one of {RADII}")
+
+        image = np.asarray(image, dtype=np.float32)
+        height = image.shape[0]
+
+        def band(top, bottom):
+            # rows of the apron come from the image, borders still clamp at its edges
+            low, high = max(top - radius, 0), min(bottom + radius, height)
+            return median_reference(image[low:high], radius)[top - low:bottom - low]
+
+        return np.concatenate(self._bands(height, band))
+
+    def raymarch(self, width, height):
+        tracer = SphereTracer(TexgenScene())
+        rgb = self._bands(height, lambda top, bottom: tracer.render_rect(width, height, (0, top, width, bottom)))
+        return to_image(np.concatenate(rgb))
+
+    def screentone(self, width, height):
+        return screentone(width, height)
+
+    def gradient(self, width, height, seed=None):
+        return vertical_gradient(width, height, seed)
+
+    def release(self):
+        self.pool.shutdown()
+
+
+class GLBackend(Backend):
+    name = "gl"
+
+    PROBE = """
+    #version 430
+    layout(local_size_x=1) in;
+    void main() {}
+    """
+
+    def __init__(self, context=None):
+        ''' raises when no GL 4.3 context with compute shaders can be created '''
+        from _context import create_headless_context
+
+        self.context = context or create_headless_context(430)
+        self.context.compute_shader(self.PROBE).release()
+
+    def _program(self, name, defines=None):
+        from _glsource import _shader_source
+        from _glprogram import _program_cache
+
+        source = _shader_source().expand(os.path.join(GL, "tex_gen", name), defines)
+        return _program_cache(self.context).compute_shader(source)
+
+    def _generate(self, program, width, height):
+        from _imagefilter import dispatch_groups
+        from _imagefilter import texture_to_array
+
+        target = self.context.texture((width, height), 4, dtype='f1')
+        target.bind_to_image(0, read=False, write=True)
+        program.run(*dispatch_groups((width, height)))
+        self.context.memory_barrier()
+
+        data = texture_to_array(target)[::-1]
+        target.release()
+        return data
+
+    def median(self, image, radius=2):
+        from _imagefilter import MedianImageFilter
+        from _imagefilter import texture_from_array
+        from _imagefilter import texture_to_array
+
+        source = texture_from_array(self.context, np.asarray(image, dtype=np.float32))
+        target = self.context.texture(source.size, 4, dtype='f4')
+        MedianImageFilter(self.context, radius).run(source, target)
+
+        data = texture_to_array(target).copy()
+        source.release()
+        target.release()
+        return data
+
+    def median_passes(self, image, radius, passes, every=None, on_frame=None):
+        ''' passes chained on the gpu, only scheduled frames are read back '''
+        from _pingpong import PingPong
+        from _imagefilter import MedianImageFilter
+
+        image = np.asarray(image, dtype=np.float32)
+        runner = PingPong(self.context, image.shape[1::-1])
+        runner.upload(image)
+        result = runner.run(MedianImageFilter(self.context, radius), passes, every, on_frame)
+        self.pass_times, self.gpu_times = runner.submit_times, runner.gpu_times
+
+        data = np.frombuffer(result.read(), dtype=np.float32).reshape(image.shape)
+        runner.release()
+        return data
+
+    def raymarch(self, width, height):
+        return self._generate(self._program("sdf_raymarch.glsl"), width, height)
+
+    def screentone(self, width, height):
+        return self._generate(self._program("screentone.glsl"), width, height)
+
+    def gradient(self, width, height, seed=None):
+        program = self._program("gradient.glsl")
+        program['palette'].value = gradient_palettes(seed)
+        program['last_row'].value = _gradient_last_row(height)
+        return self._generate(program, width, height)
+
+    def release(self):
+        self.context.release()
+
+
+BACKENDS = {
+    "gl": GLBackend,
+    "numpy": NumpyBackend,
+}
+
+_backends = {}
+
+
+def _texgen_backend(name=None):
+    '''
+    shared backend by name, "auto" or None: gl when compute shaders work, numpy otherwise
+    TEXGEN_BACKEND overrides "auto"
+    '''
+
+    name = name or os.environ.get("TEXGEN_BACKEND", "auto")
+    if name in _backends:
+        return _backends[name]
+
+    if name == "auto":
+        try:
+            backend = _texgen_backend("gl")
+        except Exception as e:
+            print(f"no compute shaders ({e}), texture generation falls back to numpy")
+            backend = _texgen_backend("numpy")
+        _backends["auto"] = backend
+        return backend
+
+    if name not in BACKENDS:
+        raise Exception(f"unknown texgen backend {name}, one of {sorted(BACKENDS.keys())}")
+    _backends[name] = BACKENDS[name]()
+    return _backends[name]
+
+
+def compare(result, golden, tolerance=0, fraction=1.0):
+    '''
+    golden image check: at least fraction of the values within tolerance
+    returns (passed, largest difference, fraction within tolerance)
+    '''
+
+    difference = np.abs(result.astype('f8') - golden.astype('f8'))
+    within = float(np.mean(difference <= tolerance))
+    return within >= fraction, float(difference.max()), within
+
+
+# per op: tolerance in bytes or float units, fraction of values that has to be within it.
+# gradient and raymarch run in float32 on gl, float64 / float32 with other rounding in numpy,
+# silhouette pixels of the raymarch may land on the other side of the hit threshold
+GOLDEN = {
+    "median": (0.0, 1.0),
+    "screentone": (0, 1.0),
+    "gradient": (1, 1.0),
+    "raymarch": (2, 0.995),
+}
+
+
+if __name__ == "__main__":
+    import sys
+
+    from PIL import Image
+
+    # python _texgen.py [width height] [--save directory]
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    width, height = (int(v) for v in args[:2]) if len(args) > 1 else (256, 256)
+    save = sys.argv[sys.argv.index("--save") + 1] if "--save" in sys.argv else None
+
+    image = np.random.uniform(0.0, 1.0, (height, width, 4)).astype('f4')
+    calls = {
+        "median": lambda backend: backend.median(image, 2),
+        "raymarch": lambda backend: backend.raymarch(width, height),
+        "screentone": lambda backend: backend.screentone(width, height),
+        "gradient": lambda backend: backend.gradient(width, height, seed=7),
+    }
+
+    backends = [_texgen_backend("numpy")]
+    try:
+        backends.append(_texgen_backend("gl"))
+    except Exception as e:
+        print(f"gl backend unavailable: {e}")
+    print(f"auto selects {_texgen_backend().name}")
+
+    for op in OPS:
+        results = {}
+        for backend in backends:
+            calls[op](backend)
+            start = time.perf_counter()
+            results[backend.name] = calls[op](backend)
+            seconds = time.perf_counter() - start
+            print(f"{op:10s} {backend.name:6s} {seconds * 1000.0:9.2f} ms")
+
+            if save and results[backend.name].dtype == np.uint8:
+                if not os.path.isdir(save):
+                    os.makedirs(save)
+                Image.fromarray(results[backend.name]).save(os.path.join(save, f"{op}_{backend.name}.png"))
+
+        if len(results) > 1:
+            tolerance, fraction = GOLDEN[op]
+            passed, largest, within = compare(results["gl"], results["numpy"], tolerance, fraction)
+            print(
+                f"{op:10s} gl vs numpy: {'pass' if passed else 'FAIL'}, "
+                f"largest difference {largest:g}, {within * 100.0:.3f}% within {tolerance}")
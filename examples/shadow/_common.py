@@ -2,24 +2,12 @@
 import math
 
 import numpy as np
-from PIL import Image
 
 
 def _read(path, args={}):
-    with open(path, 'r') as fp:
-        context = fp.read()
-
-    for k, v in args.items():
-        context = context.replace(f"%{k}", str(v))
-
-    lines = []
-    for line in context.splitlines():
-        if line.startswith("%include "):
-            include_path = line.split("%include ")[1]
-            line = _read(include_path)
-        lines.append(line)
-
-    return '\n'.join(lines)
+    ''' expanded source with %include resolved and %KEY substituted, see _glsource '''
+    from _glsource import _shader_source
+    return _shader_source().expand(path, args)
 
 
 def _flatten_array(data):
@@ -29,12 +17,14 @@ def _flatten_array(data):
     return data
 
 
-def _screen_quad(program, context, aspect=1.0):
+def _screen_quad(program, context, aspect=1.0, uv_rect=(0.0, 0.0, 1.0, 1.0)):
+    # uv_rect: u0, v0, u1, v1 covered by the quad, a sub-rect renders one tile
+    u0, v0, u1, v1 = uv_rect
     vbo = np.array([
-        -1.0, -1.0, 0.0,  0.0 * aspect, 0.0,
-        +1.0, -1.0, 0.0,  1.0 * aspect, 0.0,
-        -1.0, +1.0, 0.0,  0.0 * aspect, 1.0,
-        +1.0, +1.0, 0.0,  1.0 * aspect, 1.0,
+        -1.0, -1.0, 0.0,  u0 * aspect, v0,
+        +1.0, -1.0, 0.0,  u1 * aspect, v0,
+        -1.0, +1.0, 0.0,  u0 * aspect, v1,
+        +1.0, +1.0, 0.0,  u1 * aspect, v1,
     ]).astype('f4')
     vbo = [(
         context.buffer(vbo.tobytes()),
@@ -51,18 +41,18 @@ def _screen_quad(program, context, aspect=1.0):
 
 
 def _load_tex(context, path, force_size=None):
-    img = Image.open(path)
-    if force_size and force_size is tuple and len(force_size) == 2:
-        img = img.resize(force_size)
-    texture = _image_to_texture(context, img)
-    return texture
+    ''' shared texture from the context's texture cache, don't release it '''
+    from _gltexture import _texture_cache
+
+    if not (isinstance(force_size, tuple) and len(force_size) == 2):
+        force_size = None
+    return _texture_cache(context).get(path, size=force_size)
 
 
 def _image_to_texture(context, img):
-    img = img.convert("RGBA")
-    img = img.transpose(Image.FLIP_TOP_BOTTOM)
-    data = img.tobytes()
-    return context.texture(img.size, 4, data)
+    # flipped as a numpy view instead of a transposed image copy
+    data = np.asarray(img.convert("RGBA"))[::-1]
+    return context.texture(img.size, 4, np.ascontiguousarray(data))
 
 
 def spherified_cube_vertices(context):
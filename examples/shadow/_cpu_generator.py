@@ -1,19 +1,48 @@
+'''
+cpu texture generators
+
+every generator returns a (height, width, 4) uint8 image, rows flipped for gl
+like _common._flatten_array, and is registered in GENERATORS by name.
+the kernels live in _texgen, shared with its numpy backend,
+the _reference_ loops are the original per pixel versions they reproduce exactly.
+
+    data = generate("vertical_gradient", 512, 512, seed=1)
+'''
 
 import os
 import sys
 
 sys.path.append(os.path.dirname(__file__))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
 
 
 import numpy as np
 from PIL import Image
 
 from _common import _flatten_array
+from _texgen import gradient_palettes
+from _texgen import screentone
+from _texgen import vertical_gradient
+
+
+_gradient_palettes = gradient_palettes
+_randomized_vertical_gradient = vertical_gradient
+_generate_screentone = screentone
+
 
+GENERATORS = {
+    "vertical_gradient": _randomized_vertical_gradient,
+    "screentone": _generate_screentone,
+}
 
-def _randomized_vertical_gradient(width, height):
-    import random
 
+def generate(name, width, height, **kwargs):
+    if name not in GENERATORS:
+        raise Exception(f"unknown generator {name}, one of {sorted(GENERATORS.keys())}")
+    return GENERATORS[name](width, height, **kwargs)
+
+
+def _reference_vertical_gradient(width, height, seed=None):
     def lerp(x, y, w):
         rw = 1.0 - w
         r = x[0] * rw + y[0] * w
@@ -21,13 +50,7 @@ def _randomized_vertical_gradient(width, height):
         b = x[2] * rw + y[2] * w
         return r, g, b
 
-    palettes = []
-    for i in range(10):
-        v = i * 0.1 + random.random() * 0.1
-        palettes.append((v, v, v))
-
-    palettes[0] = (0.0, 0.0, 0.0)
-    palettes[9] = (1.0, 1.0, 1.0)
+    palettes = _gradient_palettes(seed)
 
     data = np.zeros(shape=(height, width, 4))
     for x in range(width):
@@ -45,7 +68,7 @@ def _randomized_vertical_gradient(width, height):
     return _flatten_array(data)
 
 
-def _generate_screentone(width, height):
+def _reference_screentone(width, height):
     data = np.zeros(shape=(height, width, 4))
     for x in range(height):
         for y in range(width):
@@ -56,7 +79,49 @@ def _generate_screentone(width, height):
     return _flatten_array(data)
 
 
+REFERENCES = {
+    "vertical_gradient": _reference_vertical_gradient,
+    "screentone": _reference_screentone,
+}
+
+
+def _benchmark(sizes=(512, 2048, 8192), reference_limit=2048):
+    '''
+    the loops need ~2 us per pixel and 8 bytes per channel,
+    above reference_limit their time is extrapolated from the largest size measured
+    '''
+
+    import time
+
+    for name, generator in sorted(GENERATORS.items()):
+        kwargs = {"seed": 7} if name == "vertical_gradient" else {}
+        per_pixel = None
+        for size in sizes:
+            start = time.perf_counter()
+            data = generator(size, size, **kwargs)
+            vectorised = time.perf_counter() - start
+
+            if size <= reference_limit:
+                start = time.perf_counter()
+                expected = REFERENCES[name](size, size, **kwargs)
+                reference = time.perf_counter() - start
+                per_pixel = reference / (size * size)
+                note = f"identical {np.array_equal(data, expected)}"
+            else:
+                reference = per_pixel * size * size
+                note = "loop time extrapolated"
+
+            print(
+                f"{name:18s} {size:5d}^2: loop {reference:9.3f} s, numpy {vectorised:7.4f} s, "
+                f"{reference / vectorised:8.0f}x, {note}")
+
+
 if __name__ == "__main__":
-    data = _generate_screentone(512, 512)
+    # python _cpu_generator.py [--benchmark]
+    if "--benchmark" in sys.argv:
+        _benchmark()
+        sys.exit(0)
+
+    data = generate("screentone", 512, 512)
     img = Image.fromarray(data)
     img.save("input_tex.png")
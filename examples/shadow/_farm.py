@@ -0,0 +1,183 @@
+'''
+render farm mode for cpu-only boxes
+
+llvmpipe can't keep every core busy with a single context,
+so jobs are sharded over a pool of processes, each with its own standalone context.
+
+frame ranges are split into chunks of consecutive frames,
+chunks come back through imap so frames are reassembled in order.
+single huge frames are split into tiles through the uv range of the screen quad,
+tiles match the full frame up to rounding of the interpolated uvs,
+imposter atlases are split into bands of cell rows.
+
+every worker gets an even share of the cores as llvmpipe threads,
+so n workers don't run n times the threads.
+'''
+
+import os
+import time
+import multiprocessing as mp
+
+import numpy as np
+
+from _context import create_headless_context
+from _render import SIMPLE_VS
+from _render import SceneRenderer
+from _render import _imposter_band
+
+
+# state of the worker process, filled by _init_worker
+_worker = {}
+
+
+def _init_worker(job, threads):
+    # read by llvmpipe when the context is created
+    os.environ["LP_NUM_THREADS"] = str(threads)
+
+    _worker["job"] = job
+    _worker["context"] = create_headless_context(430, job.get("backend", "auto"))
+    _worker["renderers"] = {}
+
+
+def _renderer(size, uv_rect=(0.0, 0.0, 1.0, 1.0)):
+    ''' renderers are kept per tile shape, their targets are reused across frames '''
+
+    key = (size, uv_rect)
+    renderers = _worker["renderers"]
+    if key not in renderers:
+        job = _worker["job"]
+        renderer = SceneRenderer(
+            _worker["context"], size, job["scene"],
+            output_format=job.get("format", "rgba8"), uv_rect=uv_rect)
+        for name, value in job.get("uniforms", {}).items():
+            renderer.set(name, value)
+        renderers[key] = renderer
+    return renderers[key]
+
+
+def _render_chunk(frames):
+    ''' frames: list of (u_time, campos) '''
+    renderer = _renderer(tuple(_worker["job"]["size"]))
+    return [renderer.render(u_time=u_time, u_campos=campos) for u_time, campos in frames]
+
+
+def _render_tile(tile):
+    x, y, w, h, u_time, campos = tile
+    width, height = _worker["job"]["size"]
+
+    # image rows are top first, v runs bottom up
+    uv_rect = (x / width, 1.0 - (y + h) / height, (x + w) / width, 1.0 - y / height)
+    return (x, y), _renderer((w, h), uv_rect).render(u_time=u_time, u_campos=campos)
+
+
+def _render_band(band):
+    job = _worker["job"]
+    rows, buffers = band
+    return rows, _imposter_band(
+        _worker["context"], job.get("vs", SIMPLE_VS), job["scene"], job["size"],
+        job["rows"], job["distance"], rows=rows, buffers=buffers,
+        instanced=job.get("instanced", False))
+
+
+def split_tiles(size, tiles):
+    ''' (x, y, w, h) of tiles columns x rows, from the top left corner '''
+    width, height = size
+    columns, rows = tiles
+    xs = np.linspace(0, width, columns + 1).astype(int)
+    ys = np.linspace(0, height, rows + 1).astype(int)
+    for j in range(rows):
+        for i in range(columns):
+            yield int(xs[i]), int(ys[j]), int(xs[i + 1] - xs[i]), int(ys[j + 1] - ys[j])
+
+
+class RenderFarm(object):
+    '''
+    job is a plain dict sent to every worker:
+        scene: fragment shader path
+        size: (w, h) of a frame, or atlas resolution
+        format: key of OUTPUT_FORMATS, frames only
+        uniforms: set once on every renderer
+        rows, distance: atlas cells per side and camera distance
+        instanced: atlas cells in a single draw
+        backend: context backend
+    '''
+
+    def __init__(self, job, workers=None):
+        self.job = job
+        self.workers = workers or os.cpu_count()
+
+        threads = max(1, (os.cpu_count() or 1) // self.workers)
+
+        # a forked gl context isn't safe, workers start fresh
+        self.pool = mp.get_context("spawn").Pool(
+            self.workers, _init_worker, (job, threads))
+
+    def frames(self, frames, chunk=4):
+        '''
+        frames: list of (u_time, campos),
+        yields (image, render seconds, readback seconds) in frame order
+        '''
+
+        chunks = [frames[i:i + chunk] for i in range(0, len(frames), chunk)]
+        for results in self.pool.imap(_render_chunk, chunks):
+            yield from results
+
+    def tiled_frame(self, u_time, campos, tiles=(2, 2)):
+        ''' one frame rendered as tiles columns x rows, timings summed over tiles '''
+
+        width, height = self.job["size"]
+        image = None
+        render_total, readback_total = 0.0, 0.0
+
+        jobs = [(x, y, w, h, u_time, campos) for x, y, w, h in split_tiles((width, height), tiles)]
+        for (x, y), (data, render_time, readback_time) in self.pool.imap_unordered(_render_tile, jobs):
+            if image is None:
+                image = np.empty((height, width, 4), dtype=data.dtype)
+            image[y:y + data.shape[0], x:x + data.shape[1]] = data
+
+            render_total += render_time
+            readback_total += readback_time
+        return image, render_total, readback_total
+
+    def atlas(self, buffers=False, bands=None):
+        ''' imposter atlas split into bands of cell rows, one uint8 array per output '''
+
+        res, n_row = self.job["size"], self.job["rows"]
+        bands = min(bands or self.workers * 2, n_row)
+        edges = np.linspace(0, n_row, bands + 1).astype(int)
+        jobs = [((int(edges[i]), int(edges[i + 1])), buffers) for i in range(bands)]
+
+        cell = int(res / n_row)
+        atlases = [np.zeros((res, res, 4), dtype=np.uint8) for _ in range(2 if buffers else 1)]
+        for (first, _), results in self.pool.imap_unordered(_render_band, jobs):
+            for atlas, band in zip(atlases, results):
+                atlas[first * cell:first * cell + band.shape[0]] = band
+        return atlases
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+
+def scaling(run, worker_counts):
+    '''
+    run(workers) renders the same job with a given worker count,
+    prints wall time, speedup and efficiency against the first count
+    '''
+
+    print(f"{'workers':>8} {'seconds':>9} {'speedup':>8} {'efficiency':>10}")
+
+    baseline = None
+    results = []
+    for workers in worker_counts:
+        start = time.perf_counter()
+        run(workers)
+        elapsed = time.perf_counter() - start
+
+        if baseline is None:
+            baseline = elapsed * worker_counts[0]
+        speedup = baseline / elapsed
+        efficiency = speedup / workers
+        results.append((workers, elapsed, speedup, efficiency))
+        print(f"{workers:8} {elapsed:9.2f} {speedup:8.2f} {efficiency * 100.0:9.1f}%")
+    return results
@@ -0,0 +1,46 @@
+/*
+shading and camera helpers shared by the scenes, expects PI defined
+*/
+
+float ggx(vec3 vct_dots, float rough, float min_fresnel)
+{
+    float NdL = vct_dots.x;
+    float LdH = vct_dots.y;
+    float NdH = vct_dots.z;
+
+    float a = pow(rough, 4.0);
+    float denom = 1.0 + NdH * NdH * (a - 1.0);
+
+    float rrh2 = pow(rough * rough * 0.5, 2.0);
+
+    float distribution = a / (PI * denom * denom);
+    float fresnel = 0.7 + 0.3 * pow(1.0 - LdH, 5.0);
+
+    float rcp_rrh2 = 1.0 / (1.0 - rrh2) + rrh2;
+    float _ggx = distribution * NdL * fresnel * rcp_rrh2;
+    return _ggx;
+}
+
+vec3 aces_film_tonemap(vec3 hdr)
+{
+    float a = 2.51;
+    float b = 0.03;
+    float c = 2.43;
+    float d = 0.59;
+
+    float e = 0.14;
+
+    vec3 x = hdr * (a * hdr + b);
+    vec3 y = hdr * (c * hdr + d) + e;
+
+    return clamp(x / y, 0.0, 1.0);
+}
+
+mat3 lookat(vec3 o, vec3 t, float roll)
+{
+    vec3 row_0 = vec3(sin(0.0), cos(0.0), 0.0);
+    vec3 row_1 = normalize(t - o);
+    vec3 row_2 = normalize(cross(row_1, row_0));
+    vec3 row_3 = normalize(cross(row_2, row_1));
+    return mat3(row_2, row_3, row_1);
+}
@@ -24,128 +24,7 @@ out vec2 out_uv;
 out float out_time;
 
 
-float sphere(vec3 p, float radius)
-{
-    return length(p) - radius;
-}
-
-float ellipsoid(vec3 p, vec3 r)
-{
-    float k0 = length(p / r);
-    float k1 = length(p / (r * r));
-    return k0 * (k0 - 1.0) / k1;
-}
-
-float box(vec3 p, vec3 b)
-{
-    vec3 d = abs(p) - b;
-    vec3 md = max(d, 0.0);
-    return length(md) + min(max(d.x, max(d.y, d.z)), 0.0);
-}
-
-float capsule(vec3 p, vec3 a, vec3 b, float r)
-{
-    vec3 pa = p - a;
-    vec3 ba = b - a;
-
-    // dot(p->a, a->b)
-    float dpa = dot(pa, ba);
-
-    // distance between two points
-    float dbb = dot(ba, ba);
-
-    float h = clamp(dpa / dbb, 0.0, 1.0);
-    return length(pa - ba * h) - r;
-}
-
-float cone(vec3 p, vec2 c)
-{
-    c = normalize(c);
-    float q = length(p.xy);
-    return dot(c, vec2(q, p.z));
-}
-
-float round_cone(vec3 p, float r1, float r2, float h)
-{
-    vec2 q = vec2(length(p.xz), p.y);
-    
-    float b = (r1 - r2) / h;
-    float a = sqrt(1.0 - b * b);
-    float k = dot(q,vec2(-b,a));
-    
-    if( k < 0.0 ) return length(q) - r1;
-    if( k > a * h ) return length(q - vec2(0.0, h)) - r2;
-        
-    return dot(q, vec2(a,b)) - r1;
-}
-
-float blend(float a, float b, float k)
-{
-    // return min(a, b);
-    float h = clamp(0.5 + 0.5 * (a - b) / k, 0.0, 1.0);
-    return mix(a, b, h) - k * h * (1.0 - h);
-}
-
-vec3 rotate_x(vec3 p, float r)
-{
-    float c = cos(r);
-    float s = sin(r);
-    mat3 rx = mat3(
-        1, 0, 0,
-        0, c, -s,
-        0, s, c
-    );
-
-    return rx * p;
-}
-
-vec3 rotate_y(vec3 p, float r)
-{
-    float c = cos(r);
-    float s = sin(r);
-    mat3 ry = mat3(
-        c, 0, s,
-        0, 1, 0,
-        -s, 0, c
-    );
-
-    return ry * p;
-}
-
-vec3 rotate_z(vec3 p, float r)
-{
-    float c = cos(r);
-    float s = sin(r);
-    mat3 rz = mat3(
-        c, -s, 0,
-        s, c, 0,
-        0, 0, 1
-    );
-
-    return rz * p;
-}
-
-vec3 rotate(vec3 p, vec3 r)
-{
-    vec3 c = cos(r);
-    vec3 s = sin(r);
-    mat3 rx = mat3(
-        1, 0, 0,
-        0, c.x, -s.x,
-        0, s.x, c.s
-    );
-    mat3 ry = mat3(
-        c.y, 0, s.y,
-        0, 1, 0,
-        -s.y, 0, c.y
-    );
-    mat3 rz = mat3(
-        c.z, -s.z, 0,
-        s.z, c.z, 0,
-        0, 0, 1
-    );
-    return rz * ry * rx * p;
-}
+%include ../lib/sdf.glsl
 
 float zupang(vec3 p, inout vec3 base_color)
 {
@@ -414,25 +293,6 @@ vec3 normal(vec3 p)
     ));
 }
 
-float ggx(vec3 vct_dots, float rough, float min_fresnel)
-{
-    float NdL = vct_dots.x;
-    float LdH = vct_dots.y;
-    float NdH = vct_dots.z;
-
-    float a = pow(rough, 4.0);
-    float denom = 1.0 + NdH * NdH * (a - 1.0);
-
-    float rrh2 = pow(rough * rough * 0.5, 2.0);
-
-    float distribution = a / (PI * denom * denom);
-    float fresnel = 0.7 + 0.3 * pow(1.0 - LdH, 5.0);
-
-    float rcp_rrh2 = 1.0 / (1.0 - rrh2) + rrh2;
-    float _ggx = distribution * NdL * fresnel * rcp_rrh2;
-    return _ggx;
-}
-
 float soft_shadow(vec3 o, vec3 r)
 {
     float k = 8.4;
@@ -459,29 +319,7 @@ float soft_shadow(vec3 o, vec3 r)
     return res;
 }
 
-vec3 aces_film_tonemap(vec3 hdr)
-{
-    float a = 2.51;
-    float b = 0.03;
-    float c = 2.43;
-    float d = 0.59;
-
-    float e = 0.14;
-
-    vec3 x = hdr * (a * hdr + b);
-    vec3 y = hdr * (c * hdr + d) + e;
-
-    return clamp(x / y, 0.0, 1.0);
-}
-
-mat3 lookat(vec3 o, vec3 t, float roll)
-{
-    vec3 row_0 = vec3(sin(0.0), cos(0.0), 0.0);
-    vec3 row_1 = normalize(t - o);
-    vec3 row_2 = normalize(cross(row_1, row_0));
-    vec3 row_3 = normalize(cross(row_2, row_1));
-    return mat3(row_2, row_3, row_1);
-}
+%include ../lib/shading.glsl
 
 void main()
 {
@@ -0,0 +1,120 @@
+'''
+incremental imposter baking
+
+every atlas cell is stored on disk as its own uint8 .npy,
+keyed by the expanded shader sources, the uniforms, the output layout,
+the cell resolution and the cell's camera position.
+a bake only renders cells whose key isn't on disk yet,
+cached cells are memory-mapped and copied into the atlas.
+
+    cache = ImposterCache("./.imposter_cache")
+    albedo, normal = cache.bake(context, SIMPLE_VS, "pikachu_buffers.fs", 1024, 8, 8.0, buffers=True)
+'''
+
+import os
+import hashlib
+
+import numpy as np
+
+from _common import _read
+from _render import _rotate_around
+from _render import _imposter_band
+
+
+class ImposterCache(object):
+    def __init__(self, directory):
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.npy")
+
+    @staticmethod
+    def _cell_key(base, campos):
+        # positions come out of trig, round off noise below what the shader can see
+        campos = tuple(round(float(c), 6) for c in campos)
+        return hashlib.sha1(f"{base}:{campos}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _base_key(vs, fs, cell, buffers, uniforms):
+        key = hashlib.sha1()
+        key.update(_read(vs).encode("utf-8"))
+        key.update(b"\0")
+        key.update(_read(fs).encode("utf-8"))
+        key.update(repr((cell, buffers, sorted((uniforms or {}).items()))).encode("utf-8"))
+        return key.hexdigest()
+
+    def bake(self, context, vs, fs, res, n_row=9, dist=10, buffers=False, uniforms=None):
+        '''
+        returns one uint8 atlas (res, res, 4) per output, albedo first,
+        only cells missing from the cache are rendered
+        '''
+
+        cell = int(res / n_row)
+        base = self._base_key(vs, fs, cell, buffers, uniforms)
+
+        keys = {uv: self._cell_key(base, pos) for pos, uv in _rotate_around(n_row, dist)}
+
+        # rows mirrored around the equator share camera positions, render each key once
+        missing = {}
+        for uv, key in keys.items():
+            if key not in missing and not os.path.isfile(self._path(key)):
+                missing[key] = uv
+        dirty = list(missing.values())
+
+        self.misses += len(dirty)
+        self.hits += len(keys) - len(dirty)
+
+        if dirty:
+            # only dirty rows are drawn, the rest of the band stays clear
+            rows = (min(v for _, v in dirty), max(v for _, v in dirty) + 1)
+            bands = _imposter_band(
+                context, vs, fs, res, n_row, dist,
+                rows=rows, buffers=buffers, cells=dirty, uniforms=uniforms)
+
+            for u, v in dirty:
+                y, x = (v - rows[0]) * cell, u * cell
+                data = np.stack([band[y:y + cell, x:x + cell] for band in bands])
+                self._store(keys[(u, v)], data)
+
+        outputs = 2 if buffers else 1
+        atlases = [np.zeros((res, res, 4), dtype=np.uint8) for _ in range(outputs)]
+        for (u, v), key in keys.items():
+            path = self._path(key)
+            os.utime(path)
+            data = np.load(path, mmap_mode='r')
+            for atlas, channel in zip(atlases, data):
+                atlas[v * cell:(v + 1) * cell, u * cell:(u + 1) * cell] = channel
+        return atlases
+
+    def _store(self, key, data):
+        # written aside and renamed, a killed bake never leaves half a cell
+        path = self._path(key)
+        temp = f"{path}.{os.getpid()}.tmp"
+        with open(temp, "wb") as fp:
+            np.save(fp, data)
+        os.replace(temp, path)
+
+    def size(self):
+        ''' bytes on disk '''
+        return sum(entry.stat().st_size for entry in os.scandir(self.directory) if entry.is_file())
+
+    def prune(self, max_bytes):
+        ''' drop least recently used cells until the cache fits in max_bytes '''
+        entries = sorted(
+            (entry for entry in os.scandir(self.directory) if entry.name.endswith(".npy")),
+            key=lambda entry: entry.stat().st_mtime)
+
+        total = sum(entry.stat().st_size for entry in entries)
+        for entry in entries:
+            if total <= max_bytes:
+                break
+            total -= entry.stat().st_size
+            os.remove(entry.path)
+
+    def clear(self):
+        self.prune(0)
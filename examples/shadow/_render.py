@@ -0,0 +1,598 @@
+'''
+headless rendering of the _gl/scenes raymarching shaders
+
+runs without qt, on a cpu-only box through EGL + Mesa llvmpipe
+
+usage:
+    python _render.py render zupang -o ./zupang/zupang.mp4 --size 304x304 --frames 64 --turns 1.5
+    python _render.py render yeon -o ./yeon/yeon_{frame:04}.png --start 2.4 --end 2.2 --camera fixed
+    python _render.py atlas pikachu_buffers -o ./pika/T_PikachuAtlas --size 1024 --rows 8 --distance 8
+    python _render.py atlas pikachu_buffers -o ./pika/T_PikachuAtlas --buffers --cache ./.imposter_cache
+
+sharded over processes on cpu-only boxes (see _farm.py):
+    python _render.py render zupang -o ./zupang/zupang.mp4 --frames 256 --workers 8
+    python _render.py render zupang -o ./zupang/big_{frame}.png --size 7680x4320 --tiles 4x4 --workers 8
+    python _render.py atlas pikachu -o ./pika/T_PikachuAtlas --size 8192 --rows 16 --workers 8
+    python _render.py render zupang -o unused.mp4 --frames 64 --scaling 1,2,4,8
+'''
+
+import os
+import sys
+import math
+import time
+import argparse
+
+import numpy as np
+from PIL import Image
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+from _common import _read
+from _common import _load_tex
+from _common import _screen_quad
+from _context import BACKENDS
+from _context import create_headless_context
+from _encoder import StreamWriter
+from _glprogram import enable_disk_cache
+from _glprogram import _program_cache
+from _readback import OUTPUT_FORMATS
+from _readback import FrameResolver
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SIMPLE_VS = os.path.join(HERE, "_gl", "simple.vs")
+SCENES_DIR = os.path.join(HERE, "_gl", "scenes")
+KJU_TEX = os.path.join(HERE, "_tex", "kju_sq.jpg")
+
+
+def _rotate_around(n_row=9, distance=10):
+    half = 0.5 / n_row
+    pi = math.pi
+    for i in range(n_row * n_row):
+        u = i % n_row
+        v = i // n_row
+
+        ur = u / n_row + half
+        vr = v / n_row + half
+
+        yr = abs(0.5 - vr) * 2.0
+        xzr = math.cos(math.atan2(yr, 1.0))
+        ra = 2.0 * -pi * ur
+
+        x = math.cos(ra) * distance * xzr
+        y = yr * distance
+        z = math.sin(ra) * distance * xzr
+        yield (x, y, z), (u, v)
+
+
+# a single draw covers every cell of a band, instance i is the quad of cell i
+# and carries its camera position from a storage buffer
+_INSTANCED_VS = """
+#version 430
+
+in vec3 in_verts;
+in vec2 in_uvs;
+
+uniform int u_rows;
+uniform int u_first;
+uniform vec2 u_cell;
+
+layout(std430, binding = 0) buffer Cells
+{
+    vec4 cells[];
+};
+
+out vec2 v_uvs;
+flat out vec3 v_campos;
+
+void main()
+{
+    int i = gl_InstanceID + u_first * u_rows;
+    vec2 cell = vec2(i % u_rows, gl_InstanceID / u_rows);
+
+    // cells count rows from the top, ndc y runs bottom up
+    vec2 size = u_cell * 2.0;
+    vec2 corner = in_verts.xy * 0.5 + 0.5;
+    float x = -1.0 + (cell.x + corner.x) * size.x;
+    float y = 1.0 - (cell.y + 1.0 - corner.y) * size.y;
+
+    v_uvs = in_uvs;
+    v_campos = cells[i].xyz;
+    gl_Position = vec4(x, y, 0.0, 1.0);
+}
+"""
+
+_CAMPOS_UNIFORM = "uniform vec3 u_campos;"
+
+
+def _instanced_scene(fs):
+    ''' scene source reading u_campos from the instanced vertex shader, None if it can't '''
+    if fs.count(_CAMPOS_UNIFORM) != 1:
+        return None
+    return fs.replace(_CAMPOS_UNIFORM, "flat in vec3 v_campos;\n#define u_campos v_campos")
+
+
+def _imposter_band(
+            context, vs, fs, res, n_row=9, dist=10, rows=None, buffers=False, instanced=False,
+            cells=None, uniforms=None
+        ):
+    '''
+    render the atlas cells of rows [first, last) counted from the top,
+    returns one uint8 array (band height, res, 4) per output, albedo first
+
+    every cell is drawn into one band-sized target, through its own viewport,
+    or all at once with instanced, then each output is read back once.
+
+    buffers: float albedo + normal g-buffer resolved on gpu, else one RGBA8 target
+    cells: only these (u, v) cells are drawn, the rest is left clear
+    uniforms: set on the scene program before drawing
+    '''
+
+    first, last = rows or (0, n_row)
+    if cells is not None:
+        cells = set(cells)
+        instanced = False
+    winw, winh = int(res / n_row), int(res / n_row)
+    band_size = (res, (last - first) * winh)
+
+    fs = _read(fs)
+    if instanced and _instanced_scene(fs) is None:
+        print("scene doesn't declare u_campos as a plain uniform, drawing per cell")
+        instanced = False
+
+    if instanced:
+        program = _program_cache(context).program(
+            vertex_shader=_INSTANCED_VS, fragment_shader=_instanced_scene(fs))
+        program["u_rows"].value = n_row
+        program["u_first"].value = first
+        program["u_cell"].value = (winw / band_size[0], winh / band_size[1])
+
+        campos = np.zeros((n_row * n_row, 4), dtype='f4')
+        for pos, uv in _rotate_around(n_row, dist):
+            campos[uv[1] * n_row + uv[0], :3] = pos
+        campos_buffer = context.buffer(campos.tobytes())
+        campos_buffer.bind_to_storage_buffer(0)
+    else:
+        program = _program_cache(context).program(vertex_shader=_read(vs), fragment_shader=fs)
+    vao = _screen_quad(program, context)
+
+    if "u_drawbg" in program:
+        program["u_drawbg"].value = False
+    for name, value in (uniforms or {}).items():
+        if name in program:
+            program[name].value = value
+
+    if buffers:
+        targets = [context.texture(band_size, 4, dtype="f4") for _ in range(2)]
+    else:
+        targets = [context.texture(band_size, 4)]
+    frame = context.framebuffer(targets)
+    frame.use()
+    frame.clear()
+
+    if instanced:
+        vao.render(instances=(last - first) * n_row)
+    else:
+        u_campos = program['u_campos']
+        for pos, uv in _rotate_around(n_row, dist):
+            if not first <= uv[1] < last:
+                continue
+            if cells is not None and uv not in cells:
+                continue
+
+            # viewport origin is bottom left, rows are counted from the top
+            context.viewport = (uv[0] * winw, band_size[1] - (uv[1] - first + 1) * winh, winw, winh)
+            u_campos.value = pos
+            vao.render()
+
+    shape = (band_size[1], band_size[0], 4)
+    if buffers:
+        # g-buffer stays float, quantised and flipped on gpu before readback
+        resolver = FrameResolver(context, band_size)
+        bands = [
+            np.frombuffer(resolver.resolve(texture).read(), dtype=np.uint8).reshape(shape)
+            for texture in targets
+        ]
+        resolver.release()
+    else:
+        bands = [np.frombuffer(targets[0].read(), dtype=np.uint8).reshape(shape)[::-1]]
+
+    # the program stays in the context's program cache
+    for resource in [vao, frame] + targets:
+        resource.release()
+    if instanced:
+        campos_buffer.release()
+    return bands
+
+
+def _imposter_gen(res, vs, fs, n_row=9, dist=10, context=None, instanced=False):
+    context = context or create_headless_context(430)
+    atlas, = _imposter_band(context, vs, fs, res, n_row, dist, instanced=instanced)
+    return Image.fromarray(_pad_atlas(atlas, res))
+
+
+def _imposter_gen_buffers(res, vs, fs, n_row=9, dist=10, context=None, instanced=False):
+    context = context or create_headless_context(430)
+    albedo, normal = _imposter_band(
+        context, vs, fs, res, n_row, dist, buffers=True, instanced=instanced)
+    return Image.fromarray(_pad_atlas(albedo, res)), Image.fromarray(_pad_atlas(normal, res))
+
+
+def _pad_atlas(band, res):
+    ''' cells don't cover the whole atlas when res isn't a multiple of n_row '''
+    if band.shape[0] == res:
+        return band
+    atlas = np.zeros((res, res, 4), dtype=np.uint8)
+    atlas[:band.shape[0]] = band
+    return atlas
+
+
+def _screenspace_generation(
+            width, height,
+            vspath, fspath,
+            start_time=0.0, end_time=1.0, frames=1,
+            output_format="rgba8", context=None,
+            **uniforms
+        ):
+    vs = _read(vspath)
+    fs = _read(fspath)
+
+    context = context or create_headless_context(430)
+    program = _program_cache(context).program(vertex_shader=vs, fragment_shader=fs)
+    vao = _screen_quad(program, context)
+
+    for k, v in uniforms.items():
+        if k not in program:
+            continue
+
+        program[k].value = v
+
+    test_texture = context.texture((width, height), 4)
+
+    # every format renders to float and quantises like _flatten_array,
+    # rgba32f yields the same levels as floats in [0, 1]
+    _, out_dtype = OUTPUT_FORMATS[output_format]
+    frame_tex = context.texture((width, height), 4, dtype='f4')
+    frame = context.framebuffer([frame_tex])
+    resolver = FrameResolver(context, (width, height))
+
+    u_time = {"value": 0.0}
+    if "u_time" in program:
+        u_time = program["u_time"]
+
+    span = end_time - start_time
+    step = span / max(float(frames), 1.0)
+    for t in range(int(frames)):
+        u_time.value = start_time + step * t
+
+        # the resolve samples unit 0 and binds its own framebuffer
+        frame.use()
+        test_texture.use(0)
+        vao.render()
+
+        data = np.frombuffer(resolver.resolve(frame_tex).read(), dtype=np.uint8)
+        data = data.reshape((height, width, 4))
+        if out_dtype != np.uint8:
+            data = data.astype(out_dtype) / out_dtype(255.0)
+        yield data
+
+    resolver.release()
+
+
+class SceneRenderer(object):
+    ''' one scene shader drawn into an offscreen target, timed per frame '''
+
+    def __init__(
+                self, context, size, fspath, vspath=SIMPLE_VS, output_format="rgba8",
+                uv_rect=(0.0, 0.0, 1.0, 1.0)
+            ):
+        self.context = context
+        self.size = size
+
+        # a uv sub-rect renders one tile of a bigger frame
+        self.program = _program_cache(context).program(
+            vertex_shader=_read(vspath), fragment_shader=_read(fspath))
+        self.vao = _screen_quad(self.program, context, uv_rect=uv_rect)
+
+        self.textures = []
+        if "u_kjutex" in self.program:
+            self.textures.append(_load_tex(context, KJU_TEX))
+            self.textures[0].use(0)
+
+        tex_dtype, self.dtype = OUTPUT_FORMATS[output_format]
+        self.texture = context.texture(size, 4, dtype=tex_dtype)
+        self.framebuffer = context.framebuffer([self.texture])
+
+    def set(self, name, value):
+        if name in self.program:
+            self.program[name].value = value
+
+    def render(self, **uniforms):
+        '''
+        returns image (rows top first), render seconds, readback seconds
+        '''
+
+        for k, v in uniforms.items():
+            self.set(k, v)
+
+        self.framebuffer.use()
+        start = time.perf_counter()
+        self.vao.render()
+        self.context.finish()
+        rendered = time.perf_counter()
+
+        data = np.frombuffer(self.texture.read(), dtype=self.dtype)
+        data = data.reshape((self.size[1], self.size[0], 4))
+        return data[::-1], rendered - start, time.perf_counter() - rendered
+
+
+def orbit_path(frames, distance=10.0, height=2.5, turns=1.0):
+    for i in range(frames):
+        a = 2.0 * math.pi * turns * i / frames
+        yield (math.cos(a) * distance, height, math.sin(a) * distance)
+
+
+def fixed_path(frames, campos):
+    for i in range(frames):
+        yield campos
+
+
+def file_path(frames, path):
+    ''' text file of "x y z" keys, linearly interpolated over all frames '''
+    keys = np.atleast_2d(np.loadtxt(path, dtype='f4'))
+    key_t = np.linspace(0.0, 1.0, len(keys))
+    for i in range(frames):
+        t = i / max(frames - 1, 1)
+        yield tuple(float(np.interp(t, key_t, keys[:, axis])) for axis in range(3))
+
+
+class SequenceWriter(object):
+    ''' one file per frame, pattern is formatted with frame=index '''
+
+    def __init__(self, pattern):
+        self.pattern = pattern
+        self.index = 0
+
+        directory = os.path.dirname(pattern)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def append(self, frame):
+        path = self.pattern.format(frame=self.index)
+        if path.endswith(".npy"):
+            np.save(path, frame)
+        else:
+            Image.fromarray(frame).save(path)
+        self.index += 1
+
+    def close(self):
+        pass
+
+
+def open_output(path, fps):
+    if "{" in path:
+        return SequenceWriter(path)
+
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    return StreamWriter(path, fps=fps)
+
+
+def scene_path(scene):
+    if os.path.isfile(scene):
+        return scene
+    return os.path.join(SCENES_DIR, f"{scene}.fs")
+
+
+def _vec3(text):
+    values = tuple(float(v) for v in text.split(","))
+    if len(values) != 3:
+        raise argparse.ArgumentTypeError(f"expected x,y,z: {text}")
+    return values
+
+
+def _size(text):
+    w, _, h = text.partition("x")
+    return int(w), int(h or w)
+
+
+def camera_path(args):
+    if args.camera == "orbit":
+        return orbit_path(args.frames, args.distance, args.height, args.turns)
+    if args.camera == "fixed":
+        return fixed_path(args.frames, args.campos)
+    return file_path(args.frames, args.path)
+
+
+def _worker_counts(text):
+    return [int(n) for n in text.split(",")]
+
+
+def render_frames(args, frames, workers=1):
+    '''
+    frames: list of (u_time, campos), yields (image, render seconds, readback seconds) in order
+    workers > 1 or tiles shard the job over a RenderFarm
+    '''
+
+    job = {
+        "scene": scene_path(args.scene),
+        "size": args.size,
+        "format": args.format,
+        "uniforms": {"u_focus": args.focus},
+        "backend": args.backend,
+    }
+
+    if workers <= 1 and args.tiles == (1, 1):
+        context = create_headless_context(430, args.backend)
+        print(f"{context.info['GL_RENDERER']}, {context.info['GL_VERSION']}")
+
+        renderer = SceneRenderer(context, args.size, job["scene"], output_format=args.format)
+        renderer.set("u_focus", args.focus)
+        for u_time, campos in frames:
+            yield renderer.render(u_time=u_time, u_campos=campos)
+        return
+
+    from _farm import RenderFarm
+
+    farm = RenderFarm(job, workers)
+    try:
+        if args.tiles == (1, 1):
+            yield from farm.frames(frames, args.chunk)
+        else:
+            for u_time, campos in frames:
+                yield farm.tiled_frame(u_time, campos, args.tiles)
+    finally:
+        farm.close()
+
+
+def render_command(args):
+    if args.format != "rgba8" and not args.output.endswith(".npy"):
+        raise SystemExit("float output needs a .npy frame pattern")
+
+    span = args.end - args.start
+    step = span / max(float(args.frames), 1.0)
+    frames = [(args.start + step * i, campos) for i, campos in enumerate(camera_path(args))]
+
+    if args.scaling:
+        from _farm import scaling
+
+        def run(workers):
+            for _ in render_frames(args, frames, workers):
+                pass
+
+        scaling(run, args.scaling)
+        return
+
+    output = open_output(args.output, args.fps)
+
+    render_total, readback_total = 0.0, 0.0
+    for i, (data, render_time, readback_time) in enumerate(render_frames(args, frames, args.workers)):
+        output.append(data)
+
+        render_total += render_time
+        readback_total += readback_time
+        print(
+            f"frame {i:5}: render {render_time * 1000.0:8.2f} ms, "
+            f"readback {readback_time * 1000.0:6.2f} ms")
+    output.close()
+
+    frames = max(args.frames, 1)
+    print(
+        f"{args.frames} frames, mean render {render_total / frames * 1000.0:.2f} ms, "
+        f"mean readback {readback_total / frames * 1000.0:.2f} ms")
+
+
+def bake_atlas(args, workers=1):
+    ''' albedo or albedo + normal atlas as uint8 arrays '''
+
+    if args.cache:
+        from _imposter_cache import ImposterCache
+
+        if workers > 1:
+            print("cached bakes render their missing cells in process")
+        cache = ImposterCache(args.cache)
+        atlases = cache.bake(
+            create_headless_context(430, args.backend), SIMPLE_VS, scene_path(args.scene),
+            args.size, args.rows, args.distance, buffers=args.buffers)
+        print(f"cache: {cache.hits} cells reused, {cache.misses} rendered")
+        return atlases
+
+    if workers <= 1:
+        context = create_headless_context(430, args.backend)
+        bands = _imposter_band(
+            context, SIMPLE_VS, scene_path(args.scene), args.size,
+            args.rows, args.distance, buffers=args.buffers, instanced=args.instanced)
+        return [_pad_atlas(band, args.size) for band in bands]
+
+    from _farm import RenderFarm
+
+    job = {
+        "scene": scene_path(args.scene),
+        "size": args.size,
+        "rows": args.rows,
+        "distance": args.distance,
+        "instanced": args.instanced,
+        "backend": args.backend,
+    }
+    farm = RenderFarm(job, workers)
+    try:
+        return farm.atlas(args.buffers)
+    finally:
+        farm.close()
+
+
+def atlas_command(args):
+    if args.scaling:
+        from _farm import scaling
+        scaling(lambda workers: bake_atlas(args, workers), args.scaling)
+        return
+
+    directory = os.path.dirname(args.output)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    start = time.perf_counter()
+    atlases = bake_atlas(args, args.workers)
+    if args.buffers:
+        albedo, normal = atlases
+        Image.fromarray(albedo).save(f"{args.output}_albedo.png")
+        Image.fromarray(normal).save(f"{args.output}_normal.png")
+    else:
+        Image.fromarray(atlases[0]).save(f"{args.output}.png")
+    print(f"baked {args.rows}x{args.rows} atlas in {time.perf_counter() - start:.2f} s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="headless scene renderer")
+    parser.add_argument("--backend", choices=BACKENDS, default="auto")
+    parser.add_argument("--shader-cache", help="directory for the driver's compiled shader cache")
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    render = commands.add_parser("render", help="render a frame sequence")
+    render.add_argument("scene", help="scene name in _gl/scenes or path to a .fs")
+    render.add_argument("-o", "--output", required=True, help=".mp4/.gif, or pattern with {frame}")
+    render.add_argument("--size", type=_size, default=(512, 512), help="WxH")
+    render.add_argument("--start", type=float, default=0.0, help="u_time of first frame")
+    render.add_argument("--end", type=float, default=1.0, help="u_time at end of range")
+    render.add_argument("--frames", type=int, default=1)
+    render.add_argument("--fps", type=int, default=24)
+    render.add_argument("--format", choices=sorted(OUTPUT_FORMATS), default="rgba8")
+    render.add_argument("--camera", choices=("orbit", "fixed", "file"), default="orbit")
+    render.add_argument("--distance", type=float, default=10.0, help="orbit radius")
+    render.add_argument("--height", type=float, default=2.5, help="orbit height")
+    render.add_argument("--turns", type=float, default=1.0, help="orbit turns over the range")
+    render.add_argument("--campos", type=_vec3, default=(0.0, 10.0, -10.0), help="fixed camera x,y,z")
+    render.add_argument("--path", help="camera keys file for --camera file")
+    render.add_argument("--focus", type=_vec3, default=(0.0, 2.0, 0.0), help="x,y,z")
+    render.add_argument("--workers", type=int, default=1, help="render processes")
+    render.add_argument("--chunk", type=int, default=4, help="consecutive frames per worker task")
+    render.add_argument("--tiles", type=_size, default=(1, 1), help="split every frame into CxR tiles")
+    render.add_argument("--scaling", type=_worker_counts, help="report scaling for worker counts, e.g. 1,2,4")
+    render.set_defaults(run=render_command)
+
+    atlas = commands.add_parser("atlas", help="bake an imposter atlas")
+    atlas.add_argument("scene")
+    atlas.add_argument("-o", "--output", required=True, help="output path without extension")
+    atlas.add_argument("--size", type=int, default=1024)
+    atlas.add_argument("--rows", type=int, default=8)
+    atlas.add_argument("--distance", type=float, default=8.0)
+    atlas.add_argument("--buffers", action="store_true", help="albedo + normal g-buffer scene")
+    atlas.add_argument("--instanced", action="store_true", help="all cells in a single draw")
+    atlas.add_argument("--cache", help="directory of baked cells, only changed cells are rendered")
+    atlas.add_argument("--workers", type=int, default=1, help="render processes, split by cell rows")
+    atlas.add_argument("--scaling", type=_worker_counts, help="report scaling for worker counts, e.g. 1,2,4")
+    atlas.set_defaults(run=atlas_command)
+
+    args = parser.parse_args(argv)
+    if getattr(args, "camera", None) == "file" and not args.path:
+        parser.error("--camera file needs --path")
+
+    # before any context, farm workers inherit it through the environment
+    enable_disk_cache(args.shader_cache)
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,13 @@
+#version 430
+
+uniform sampler2D a;
+uniform sampler2D b;
+uniform float amount;
+
+in vec2 v_uvcoord;
+out vec4 out_color;
+
+void main()
+{
+    out_color = mix(texture(a, v_uvcoord), texture(b, v_uvcoord), amount);
+}
@@ -0,0 +1,54 @@
+
+//
+// (2 * RADIUS + 1)^2 convolution from a texture into an image of the same size
+//
+// weights are row major, bottom row first, applied as a correlation:
+// out(x, y) = sum weights[wx + wy * SIDE] * in(x + wx - RADIUS, y + wy - RADIUS)
+// each 16x16 workgroup stages its tile plus apron in shared memory, borders clamp to the edge
+//
+
+#version 430
+
+#define RADIUS %%RADIUS%%
+#define TILE 16
+#define SIDE (2 * RADIUS + 1)
+#define WINDOW (SIDE * SIDE)
+#define APRON (TILE + 2 * RADIUS)
+
+layout(local_size_x=TILE, local_size_y=TILE, local_size_z=1) in;
+layout(binding=0) uniform sampler2D source;
+layout(binding=1) writeonly uniform image2D target;
+
+uniform float weights[WINDOW];
+
+shared vec4 colors[APRON * APRON];
+
+void main()
+{
+    const ivec2 size = textureSize(source, 0);
+    const ivec2 origin = ivec2(gl_WorkGroupID.xy) * TILE - RADIUS;
+
+    for (uint i = gl_LocalInvocationIndex; i < APRON * APRON; i += TILE * TILE)
+    {
+        ivec2 src = origin + ivec2(i % APRON, i / APRON);
+        colors[i] = texelFetch(source, clamp(src, ivec2(0), size - 1), 0);
+    }
+    barrier();
+
+    const ivec2 pixel = ivec2(gl_GlobalInvocationID.xy);
+    if (pixel.x >= size.x || pixel.y >= size.y)
+    {
+        return;
+    }
+
+    const ivec2 local = ivec2(gl_LocalInvocationID.xy);
+    vec4 sum = vec4(0.0);
+    for (int wy = 0; wy < SIDE; wy++)
+    {
+        for (int wx = 0; wx < SIDE; wx++)
+        {
+            sum += weights[wx + wy * SIDE] * colors[local.x + wx + (local.y + wy) * APRON];
+        }
+    }
+    imageStore(target, pixel, sum);
+}
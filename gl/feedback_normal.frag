@@ -0,0 +1,23 @@
+#version 430
+
+//
+// one step of the normalmap feedback loop:
+// depth_to_normal of the previous frame blended with per frame noise
+//
+
+%include lib/depth_to_normal.glsl
+%include lib/hash.glsl
+
+uniform sampler2D source;
+uniform uint frame;
+uniform float blend;
+
+in vec2 v_uvcoord;
+out vec4 out_color;
+
+void main()
+{
+    vec4 color = depth_to_normal(source, v_uvcoord);
+    vec3 noise = hash_noise(uvec2(gl_FragCoord.xy), frame);
+    out_color = vec4(mix(color.rgb, noise, blend), 1.0);
+}
@@ -0,0 +1,16 @@
+//
+// depth to normal filter, 4 taps around uv averaged
+//
+
+vec4 depth_to_normal(sampler2D source, vec2 uv)
+{
+    const vec2 offset = vec2(0.0, 0.002);
+    vec4 tex_color_00 = texture(source, uv + offset.xy);
+    vec4 tex_color_01 = texture(source, uv + offset.yx);
+    vec4 tex_color_10 = texture(source, uv + offset.xy);
+    vec4 tex_color_11 = texture(source, uv + offset.yx);
+
+    vec4 color = tex_color_00 + tex_color_01 + tex_color_10 + tex_color_11;
+    color *= 0.25;
+    return vec4(color.xyz, 1.0);
+}
@@ -0,0 +1,20 @@
+//
+// pcg hash, uniform uint noise from integer coordinates without a noise texture
+//
+
+uint pcg_hash(uint v)
+{
+    uint state = v * 747796405u + 2891336453u;
+    uint word = ((state >> ((state >> 28u) + 4u)) ^ state) * 277803737u;
+    return (word >> 22u) ^ word;
+}
+
+// 3 values in [0, 1) for a pixel and frame
+vec3 hash_noise(uvec2 pixel, uint frame)
+{
+    uint seed = pcg_hash(pixel.x + pcg_hash(pixel.y + pcg_hash(frame)));
+    uint r = pcg_hash(seed);
+    uint g = pcg_hash(r);
+    uint b = pcg_hash(g);
+    return vec3(r, g, b) * (1.0 / 4294967296.0);
+}
@@ -0,0 +1,72 @@
+//
+// median filter body, (2 * RADIUS + 1)^2 window
+//
+// the including kernel defines RADIUS and TILE, declares
+// local_size_x=TILE, local_size_y=TILE and provides
+//     ivec2 image_size()
+//     vec4 load(ivec2 texel)                texel is inside the image
+//     void store(ivec2 texel, vec4 color)
+//
+// each workgroup stages its tile plus a RADIUS wide apron in shared memory,
+// borders clamp to the edge.
+// window entries are luminance keys packed with their window index, (key << 8) | index,
+// so comparisons are plain uint min/max and equal luminance orders by raster position.
+// NETWORK below is a compare-exchange network selecting the median, generated by _median.py
+//
+
+#define SIDE (2 * RADIUS + 1)
+#define WINDOW (SIDE * SIDE)
+#define APRON (TILE + 2 * RADIUS)
+
+shared vec4 colors[APRON * APRON];
+shared uint keys[APRON * APRON];
+
+uint luminance_key(vec4 color)
+{
+    // rec. 709, 16 bits
+    float luminance = color.r * 0.2126 + color.g * 0.7152 + color.b * 0.0722;
+    return uint(clamp(luminance, 0.0, 1.0) * 65535.0 + 0.5);
+}
+
+#define CSWAP(a, b) { uint low = min(v[a], v[b]); v[b] = max(v[a], v[b]); v[a] = low; }
+
+void main()
+{
+    const ivec2 size = image_size();
+    const ivec2 origin = ivec2(gl_WorkGroupID.xy) * TILE - RADIUS;
+
+    // every invocation loads, the ones outside the image too, barrier() needs all of them
+    for (uint i = gl_LocalInvocationIndex; i < APRON * APRON; i += TILE * TILE)
+    {
+        ivec2 src = origin + ivec2(i % APRON, i / APRON);
+        src = clamp(src, ivec2(0), size - 1);
+
+        vec4 color = load(src);
+        colors[i] = color;
+        keys[i] = luminance_key(color);
+    }
+    barrier();
+
+    const ivec2 pixel = ivec2(gl_GlobalInvocationID.xy);
+    if (pixel.x >= size.x || pixel.y >= size.y)
+    {
+        return;
+    }
+
+    const ivec2 local = ivec2(gl_LocalInvocationID.xy);
+    uint v[WINDOW];
+    for (int wy = 0; wy < SIDE; wy++)
+    {
+        for (int wx = 0; wx < SIDE; wx++)
+        {
+            int win_i = wx + wy * SIDE;
+            v[win_i] = (keys[local.x + wx + (local.y + wy) * APRON] << 8) | uint(win_i);
+        }
+    }
+
+%%NETWORK%%
+
+    int win_i = int(v[WINDOW / 2] & 0xffu);
+    ivec2 offset = ivec2(win_i % SIDE, win_i / SIDE);
+    store(pixel, colors[local.x + offset.x + (local.y + offset.y) * APRON]);
+}
@@ -0,0 +1,9 @@
+//
+// rgba8 targets round on store, numpy truncates with (v * 255.99).astype(np.uint8),
+// storing unorm8(color) gives the truncated bytes instead
+//
+
+vec4 unorm8(vec4 color)
+{
+    return floor(clamp(color, 0.0, 1.0) * 255.99) / 255.0;
+}
@@ -0,0 +1,31 @@
+
+//
+// median filter from a texture into an image of the same size, see lib/median.glsl
+// size comes from the bound texture, dispatch ceil(width / 16) x ceil(height / 16) groups
+//
+
+#version 430
+
+#define RADIUS %%RADIUS%%
+#define TILE 16
+
+layout(local_size_x=TILE, local_size_y=TILE, local_size_z=1) in;
+layout(binding=0) uniform sampler2D source;
+layout(binding=1) writeonly uniform image2D target;
+
+ivec2 image_size()
+{
+    return textureSize(source, 0);
+}
+
+vec4 load(ivec2 texel)
+{
+    return texelFetch(source, texel, 0);
+}
+
+void store(ivec2 texel, vec4 color)
+{
+    imageStore(target, texel, color);
+}
+
+%include lib/median.glsl
@@ -0,0 +1,39 @@
+
+//
+// median filter over storage buffers, rows of W vec4, see lib/median.glsl
+//
+
+#version 430
+
+#define W %%W%%
+#define H %%H%%
+#define RADIUS %%RADIUS%%
+#define TILE 16
+
+layout(local_size_x=TILE, local_size_y=TILE, local_size_z=1) in;
+layout (std430, binding=0) buffer in_0
+{
+    vec4 inxs[];
+};
+
+layout (std430, binding=1) buffer out_0
+{
+    vec4 outxs[];
+};
+
+ivec2 image_size()
+{
+    return ivec2(W, H);
+}
+
+vec4 load(ivec2 texel)
+{
+    return inxs[texel.x + texel.y * W];
+}
+
+void store(ivec2 texel, vec4 color)
+{
+    outxs[texel.x + texel.y * W] = color;
+}
+
+%include lib/median.glsl
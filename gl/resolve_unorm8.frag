@@ -0,0 +1,19 @@
+#version 330
+
+//
+// float render target to rgba8 with the truncation of _common._flatten_array
+//
+
+%include lib/unorm8.glsl
+
+uniform sampler2D source;
+
+out vec4 out_color;
+
+void main()
+{
+    // texel for texel and flipped, no filtering whatever the source's filter is
+    ivec2 texel = ivec2(gl_FragCoord.xy);
+    texel.y = textureSize(source, 0).y - 1 - texel.y;
+    out_color = unorm8(texelFetch(source, texel, 0));
+}
@@ -0,0 +1,36 @@
+
+//
+// vertical gradient through 10 palette stops, 0.1 apart
+// rows from 0.9 up repeat last_row, the last one below 0.9
+//
+
+#version 430
+
+layout(local_size_x=16, local_size_y=16, local_size_z=1) in;
+layout(binding=0) writeonly uniform image2D target;
+
+uniform vec3 palette[10];
+uniform int last_row;
+
+%include ../lib/unorm8.glsl
+
+void main()
+{
+    const ivec2 size = imageSize(target);
+    const ivec2 texel = ivec2(gl_GlobalInvocationID.xy);
+    if (any(greaterThanEqual(texel, size)))
+    {
+        return;
+    }
+
+    float hr = float(min(texel.y, last_row)) / float(size.y);
+    int i = 1;
+    while (i < 9 && hr >= float(i) * 0.1)
+    {
+        i++;
+    }
+
+    float w = (hr - float(i - 1) * 0.1) / 0.1;
+    vec3 rgb = palette[i - 1] * (1.0 - w) + palette[i] * w;
+    imageStore(target, texel, unorm8(vec4(rgb, 1.0)));
+}
@@ -0,0 +1,24 @@
+
+//
+// black where row and column agree mod 4, white elsewhere
+// texture row y is image row height - 1 - y, like _flatten_array
+//
+
+#version 430
+
+layout(local_size_x=16, local_size_y=16, local_size_z=1) in;
+layout(binding=0) writeonly uniform image2D target;
+
+%include ../lib/unorm8.glsl
+
+void main()
+{
+    const ivec2 texel = ivec2(gl_GlobalInvocationID.xy);
+    if (any(greaterThanEqual(texel, imageSize(target))))
+    {
+        return;
+    }
+
+    float tone = (texel.y % 4) == (texel.x % 4) ? 0.0 : 1.0;
+    imageStore(target, texel, unorm8(vec4(vec3(tone), 1.0)));
+}
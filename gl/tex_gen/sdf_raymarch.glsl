@@ -0,0 +1,99 @@
+
+//
+// sphere smoothly blended with a box, sphere traced and lit in grey
+// same scene as compute_median.glsl, one invocation per texel at any image size
+//
+
+#version 430
+
+layout(local_size_x=16, local_size_y=16, local_size_z=1) in;
+layout(binding=0) writeonly uniform image2D target;
+
+%include ../lib/unorm8.glsl
+
+float blend(float a, float b, float k)
+{
+    float h = clamp(0.5 + 0.5 * (a - b) / k, 0.0, 1.0);
+    return mix(a, b, h) - k * h * (1.0 - h);
+}
+
+float box(vec3 p, vec3 b)
+{
+    return length(max(abs(p) - b, 0.0));
+}
+
+float sphere(vec3 cursor, float r)
+{
+    return length(cursor) - r;
+}
+
+float sample_world(vec3 cursor)
+{
+    float ds = sphere(cursor - vec3(0.5, 0.0, -0.6), 0.75);
+    float db = box(cursor - vec3(-0.5, 0.0, 0.0), vec3(0.35));
+    return blend(ds, db, 0.5);
+}
+
+float raymarch(vec3 origin, vec3 ray)
+{
+    float travel = 0.0;
+    for (int i = 0; i < 128; i++)
+    {
+        float distance = sample_world(origin + ray * travel);
+        if (abs(distance) < 0.002)
+        {
+            return travel;
+        }
+
+        travel += distance;
+    }
+
+    return 50.0;
+}
+
+vec3 get_normal(vec3 p)
+{
+    vec2 o = vec2(0.001, 0.0);
+    return normalize(vec3(
+        sample_world(p + o.xyy) - sample_world(p - o.xyy),
+        sample_world(p + o.yxy) - sample_world(p - o.yxy),
+        sample_world(p + o.yyx) - sample_world(p - o.yyx)
+    ));
+}
+
+void main()
+{
+    const ivec2 size = imageSize(target);
+    const ivec2 texel = ivec2(gl_GlobalInvocationID.xy);
+    if (any(greaterThanEqual(texel, size)))
+    {
+        return;
+    }
+
+    vec2 uv = vec2(texel) / vec2(size);
+
+    vec3 origin = vec3(0, 0, -5.0);
+    vec3 ray = normalize(vec3(uv - vec2(0.5, 0.5), 1.0001));
+    vec3 light = normalize(vec3(-3.0, 3.0, 1.0));
+
+    vec3 rgb = vec3(0.0);
+
+    float distance = raymarch(origin, ray);
+    if (distance < 50.0)
+    {
+        vec3 normal = get_normal(origin + ray * distance);
+
+        vec3 view = -origin;
+        vec3 half_vl = normalize(view + light);
+
+        // pow of a negative base is undefined in glsl, facing away has no highlight
+        float ndh = max(dot(normal, -half_vl), 0.0);
+
+        float diffuse = dot(-light, normal);
+        float spec = clamp(pow(ndh, 128.0), 0.0, 1.0);
+
+        rgb = vec3(diffuse + spec);
+    }
+
+    imageStore(target, texel, unorm8(vec4(rgb, 1.0)));
+}
@@ -14,8 +14,15 @@ from PyQt5.QtCore import QObject
 from PyQt5.QtCore import pyqtSlot
 from PyQt5.QtCore import pyqtSignal
 
+from watchdog.observers import Observer
+
+from _hotreload import ReloadCoordinator
+from _nodegraph import Graph
+from _nodegraph import ImageNode
 from nodes2d import PassThrough2D
 from nodes2d import DepthToNormal
+from nodes2d import DepthToNormalNode
+from nodes2d import FeedbackLoop
 from ui.mainwindow import Ui_window
 
 
@@ -49,6 +56,10 @@ class NodeWidget(QtWidgets.QOpenGLWidget):
     i = 0
     context = None
     viewport = (0, 0, 0, 0)
+    _screen = None
+
+    # repaint continuously, otherwise only when qt asks or update() is called
+    animated = False
 
     def __init__(self):
         super(NodeWidget, self).__init__()
@@ -63,7 +74,15 @@ class NodeWidget(QtWidgets.QOpenGLWidget):
     def paintGL(self):
         self.context.viewport = self.viewport
         self.render()
-        self.update()
+        if self.animated:
+            self.update()
+
+    def screen_framebuffer(self):
+        ''' qt's framebuffer for the widget, it changes on resize '''
+        glo = self.defaultFramebufferObject()
+        if not self._screen or self._screen.glo != glo:
+            self._screen = self.context.detect_framebuffer(glo)
+        return self._screen
 
     def initializeGL(self):
         if not self.context:
@@ -72,32 +91,59 @@ class NodeWidget(QtWidgets.QOpenGLWidget):
         self.init_node()
 
 class NormalmapNode(NodeWidget):
-    def __init__(self):
+    animated = True
+    size = (512, 512)
+    loop = None
+
+    def __init__(self, feedback=True):
+        '''
+        feedback: ping-pong the normalmap on the gpu with FeedbackLoop,
+        False keeps the cpu blend that reads back and uploads every frame
+        '''
         super(NormalmapNode, self).__init__()
+        self.feedback = feedback
 
     def init_node(self):
-        size = (512, 512)
         channels = 3
-        array = np.random.uniform(0, 255, (*size, channels)).astype(np.uint8)
+        array = np.random.uniform(0, 255, (*self.size, channels)).astype(np.uint8)
         img = Image.fromarray(array)
         aspect = self.width() / self.height()
         self.device = DepthToNormal(self.context, img, aspect)
+        if self.feedback:
+            self.loop = FeedbackLoop(self.context, img, self.size)
+
+    def snapshot(self):
+        ''' current normalmap as an RGB PIL image, the only readback of the feedback mode '''
+        if self.loop:
+            return self.loop.snapshot()
+        return Image.frombytes("RGB", self.device.texture.size, self.device.texture.read())
 
     def render(self):
+        if not self.loop:
+            self._render_cpu()
+            return
+
+        self.loop.step()
+
+        self.screen_framebuffer().use()
+        self.context.viewport = self.viewport
+        self.device.texture = self.loop.texture
+        self.device.render()
+
+    def _render_cpu(self):
         self.device.render()
 
-        size = (512, 512)
         channels = 3
 
-        fb = self.context.simple_framebuffer(size)
+        fb = self.context.simple_framebuffer(self.size)
         fb.use()
         self.device.render()
 
         fb_data = fb.read()
-        img = Image.frombytes("RGB", size, fb_data)
+        img = Image.frombytes("RGB", self.size, fb_data)
         img.transpose(Image.ROTATE_90)
 
-        array = np.random.uniform(0, 255, (*size, channels)).astype(np.uint8)
+        array = np.random.uniform(0, 255, (*self.size, channels)).astype(np.uint8)
         add_img = Image.fromarray(array)
 
         img = Image.blend(img, add_img, 0.2)
@@ -108,8 +154,74 @@ class NormalmapNode(NodeWidget):
         print(self, "click", self.context)
 
 
+def _normalmap_graph(context):
+    ''' image -> depth_to_normal, the image is noise until a psd is loaded '''
+    size = (512, 512)
+    channels = 3
+    array = np.random.uniform(0, 255, (*size, channels)).astype(np.uint8)
+
+    graph = Graph(context)
+    image = graph.add(ImageNode(context, Image.fromarray(array)))
+    normal = graph.add(DepthToNormalNode(context))
+    graph.connect(image, "out", normal, "source")
+    return graph, normal
+
+
+class GraphWidget(NodeWidget):
+    '''
+    shows one output of a _nodegraph.Graph, the graph runs only when a node changed
+    and the widget repaints only then, an idle graph costs no gpu work.
+    saved edits to the graph's shaders or their includes reload the nodes using them
+    '''
+
+    # paths of a burst of shader saves, delivered on the gui thread
+    signal_shaders_changed = pyqtSignal(object)
+
+    def __init__(self, build, watch_path="./gl/"):
+        ''' build(context): returns (graph, node) to display, called once the context exists '''
+        super(GraphWidget, self).__init__()
+        self.build = build
+        self.graph = None
+
+        self.watch_path = watch_path
+        self.observer = None
+        self.coordinator = ReloadCoordinator(self.signal_shaders_changed.emit)
+        self.signal_shaders_changed.connect(self.on_shaders_changed)
+
+    def init_node(self):
+        self.graph, self.node = self.build(self.context)
+        self.graph.on_dirty = self.update
+        self.device = PassThrough2D(self.context, None, self.width() / self.height())
+
+        self.coordinator.follow(*self.graph.shader_paths())
+        self.observer = Observer()
+        self.observer.daemon = True
+        self.observer.schedule(self.coordinator, self.watch_path, recursive=True)
+        self.observer.start()
+
+    def on_shaders_changed(self, paths):
+        # shaders that fail to build are logged by the graph and keep their last program
+        self.makeCurrent()
+        try:
+            changed = self.graph.reload_shaders()
+        finally:
+            self.doneCurrent()
+
+        # reloaded nodes are dirty, graph.on_dirty scheduled the repaint
+        print(f"reloaded {[type(node).__name__ for node in changed]} for {paths}")
+
+    def render(self):
+        self.graph.evaluate()
+
+        self.screen_framebuffer().use()
+        self.context.viewport = self.viewport
+        self.device.texture = self.graph.texture(self.node)
+        self.device.render()
+
+
 class Tool(QObject):
     normalmap_node = None
+    graph_node = None
 
     @property
     def path(self):
@@ -133,9 +245,12 @@ class ToolWindow(Ui_window, QObject):
         self.qt_win = qt_win
 
         self.tool = Tool(self)
-        self.tool.normalmap_node = NormalmapNode()
+        self.tool.normalmap_node = NormalmapNode(feedback=True)
+        # depth_to_normal of the same kind of image, repainted on edits only
+        self.tool.graph_node = GraphWidget(_normalmap_graph)
 
         self.hl_canvasgroup.addWidget(self.tool.normalmap_node)
+        self.hl_canvasgroup.addWidget(self.tool.graph_node)
 
         self.b_exit.clicked.connect(lambda e: qt_win.close())
         self.b_refresh.clicked.connect(self.refresh_psd)
@@ -1,13 +1,19 @@
+import numpy as np
 
 from _glloader import _Loader
+from _nodegraph import RGBA8
+from _nodegraph import ShaderNode
 
 
 class PassThrough2D(_Loader):
-    def __init__(self, gl_context, img):
+    def __init__(self, gl_context, img, aspect=1.0):
         super(PassThrough2D, self).__init__()
 
         self.context = gl_context
-        self.build_quad_vao(self.context, img, "./gl/passthrough2d.frag")
+        self.recompile_shader("./gl/passthrough2d.frag")
+        if img:
+            self.rebuild_texture(img)
+        self.rebuild_quad(aspect)
 
     def render(self):
         self.texture.use(0)
@@ -26,3 +32,143 @@ class DepthToNormal(_Loader):
     def render(self):
         self.texture.use(location=0)
         self.vao.render()
+
+
+class DepthToNormalNode(ShaderNode):
+    inputs = {"source": RGBA8}
+    fragment = "./gl/depth_to_normal.frag"
+
+
+class BlendNode(ShaderNode):
+    ''' mix(a, b, amount), amount 0.2 until set '''
+
+    inputs = {"a": RGBA8, "b": RGBA8}
+    fragment = "./gl/blend.frag"
+
+    def __init__(self, gl_context, size=None, cache=True):
+        super(BlendNode, self).__init__(gl_context, size, cache)
+        self.set("amount", 0.2)
+
+
+class FeedbackLoop(_Loader):
+    '''
+    normalmap feedback on the gpu: each step renders depth_to_normal of the current texture
+    blended with hashed noise into the other one, then swaps them.
+    textures, framebuffers and the quad are made once, steps allocate nothing
+    and only snapshot() reads back
+    '''
+
+    def __init__(self, gl_context, img, size=(512, 512), blend=0.2):
+        super(FeedbackLoop, self).__init__()
+        self.context = gl_context
+        self.size = tuple(size)
+        self.blend = blend
+        self.frame = 0
+
+        self.recompile_shader("./gl/feedback_normal.frag")
+        # the step covers the whole target, only the display quad follows the widget aspect
+        self.rebuild_quad(1.0)
+
+        self.textures = [self.context.texture(self.size, 4) for _ in range(2)]
+        self.framebuffers = [self.context.framebuffer([texture]) for texture in self.textures]
+        self._current = 0
+        if img:
+            self.upload(img)
+
+    @property
+    def texture(self):
+        ''' texture holding the last step '''
+        return self.textures[self._current]
+
+    def upload(self, img):
+        self._current = 0
+        self.textures[0].write(img.convert("RGBA").resize(self.size).tobytes())
+
+    def step(self):
+        ''' leaves the target framebuffer bound, rebind the screen before drawing to it '''
+        target = 1 - self._current
+        self.framebuffers[target].use()
+        self.textures[self._current].use(location=0)
+
+        self.program['frame'].value = self.frame
+        self.program['blend'].value = self.blend
+        self.vao.render()
+
+        self.frame = (self.frame + 1) % (1 << 32)
+        self._current = target
+
+    def snapshot(self):
+        ''' the last step as an RGB PIL image, rows as the old cpu loop read them '''
+        from PIL import Image
+        return Image.frombytes("RGB", self.size, self.framebuffers[self._current].read(components=3))
+
+    def release(self):
+        for resource in self.framebuffers + self.textures:
+            resource.release()
+        self.framebuffers = []
+        self.textures = []
+
+
+if __name__ == "__main__":
+    import time
+
+    from PIL import Image
+
+    from _context import create_headless_context
+
+    # python nodes2d.py
+    size = (512, 512)
+    frames = 200
+    context = create_headless_context(430)
+    img = Image.fromarray(np.random.uniform(0, 255, (*size, 3)).astype(np.uint8))
+
+    # without noise a step is the depth_to_normal pass over a full target
+    device = DepthToNormal(context, img, 1.0)
+    fb = context.simple_framebuffer(size)
+    fb.use()
+    device.render()
+    loop = FeedbackLoop(context, img, size, blend=0.0)
+    loop.step()
+    print(f"noise free step matches depth_to_normal: {loop.snapshot().tobytes() == fb.read()}")
+
+    # noise is uniform, changes every frame and the blend keeps 0.2 of it
+    loop.blend = 1.0
+    loop.step()
+    first = np.asarray(loop.snapshot(), dtype='f8') / 255.0
+    loop.step()
+    second = np.asarray(loop.snapshot(), dtype='f8') / 255.0
+    print(
+        f"noise: mean {first.mean():.4f}, std {first.std():.4f} (uniform 0.5000, 0.2887), "
+        f"frames differ {np.mean(first != second) * 100.0:.1f}%")
+
+    # the per paint loop of NormalmapNode before, with its per frame framebuffer and texture
+    def cpu_frame(device):
+        device.render()
+        fb = context.simple_framebuffer(size)
+        fb.use()
+        device.render()
+        img = Image.frombytes("RGB", size, fb.read())
+        noise = Image.fromarray(np.random.uniform(0, 255, (*size, 3)).astype(np.uint8))
+        device.rebuild_texture(Image.blend(img, noise, 0.2))
+
+    loop = FeedbackLoop(context, img, size)
+    screen = context.simple_framebuffer(size)
+    for name, run in (("cpu blend + new texture", lambda: cpu_frame(device)), ("gpu feedback loop", None)):
+        if run is None:
+            def run():
+                loop.step()
+                screen.use()
+                device.texture = loop.texture
+                device.render()
+
+        run()
+        context.finish()
+        start = time.perf_counter()
+        for _ in range(frames):
+            run()
+        context.finish()
+        seconds = (time.perf_counter() - start) / frames
+        print(f"{name:24s} {seconds * 1000.0:8.3f} ms per frame")
+
+    # both loops settle to the same level, the noise mean pulled through the filter
+    print(f"gpu loop mean after {frames + 1} frames: {np.asarray(loop.snapshot()).mean():.1f}")
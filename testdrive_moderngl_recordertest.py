@@ -7,6 +7,8 @@ import imageio as ii
 
 from PyQt5 import QtWidgets
 
+from _readback import AsyncReadback
+
 
 vertex_shader = """
 #version 430
@@ -206,7 +208,7 @@ class Renderer(QtWidgets.QOpenGLWidget):
                 "3f 2f",
                 "in_verts", "in_uv"
             )], self.context.buffer(indices.tobytes()))
-        self.out_texture = self.context.texture((self.W, self.H), 4, dtype='f4')
+        self.out_texture = self.context.texture((self.W, self.H), 4)
         self.framebuffer = self.context.framebuffer(self.out_texture)
 
         self.unif_t = program['T']
@@ -215,6 +217,7 @@ class Renderer(QtWidgets.QOpenGLWidget):
 
         if self.RECORDING:
             self.writer = ii.get_writer("output.mp4", fps=60)
+            self.readback = AsyncReadback(self.context, (self.W, self.H))
 
     def paintGL(self):
         t = time.time()
@@ -229,16 +232,19 @@ class Renderer(QtWidgets.QOpenGLWidget):
         if self.RECORDING:
             self.framebuffer.use()
             self.vao.render()
-            data = np.frombuffer(self.out_texture.read(), dtype=np.float32)
-            data = data.reshape((self.W, self.H, 4))
-            data = data * 255.0
-            data = data.astype(np.uint8)
-            self.writer.append_data(data)
+            for data in self.readback.push(self.out_texture):
+                self.write(data)
+
+    def write(self, data):
+        self.writer.append_data(data)
 
     def closeEvent(self, e):
         self.hide()
 
         if self.RECORDING:
+            self.makeCurrent()
+            for data in self.readback.flush():
+                self.write(data)
             self.writer.close()
 
 
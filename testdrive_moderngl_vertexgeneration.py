@@ -6,66 +6,111 @@ author: minu jeong
 
 import sys
 import time
-from threading import Thread
-from queue import Queue
-from threading import Event
+import weakref
 
 import numpy as np
 import moderngl as mg
-import imageio as ii
+
+from _encoder import EncoderProcess
+from _glsource import _shader_source
+from _glprogram import _program_cache
+from _readback import AsyncReadback
 
 
 class ProgramPool(object):
+    """
+    named programs of one context, compiled once and shared by every mesh
+
+    sources go through _glsource, so edited files (or includes) are noticed,
+    changed() lists programs whose sources moved on and invalidate() drops them,
+    the next get() compiles again
+    """
+
     def __init__(self, context):
-        self._programs = {}
-        self._cache = {}
         self.context = context
+        self._sources = {}
+        self._programs = {}
+        self._stats = {}
 
-        self._programs["uvdebug"] = (
-            self._load('./gl/testdrives/vs_simple.glsl'),
-            self._load('./gl/testdrives/fs_uvdebug.glsl')
-        )
+        self.register("uvdebug", './gl/testdrives/vs_simple.glsl', './gl/testdrives/fs_uvdebug.glsl')
 
-    def _load(self, filename):
-        if filename in self._cache.keys():
-            return self._cache[filename]
+    def register(self, key, vs_path, fs_path):
+        self._sources[key] = (vs_path, fs_path)
+        self._stats.setdefault(key, {"hits": 0, "misses": 0, "compiles": 0, "compile_time": 0.0})
 
-        with open(filename, 'r') as fp:
-            ctx = fp.read()
-        return ctx
+    def _load(self, key):
+        vs_path, fs_path = self._sources[key]
+        return _shader_source().expand(vs_path), _shader_source().expand(fs_path)
 
     def get(self, key):
-        if key in self._programs.keys():
-            vs, fs = self._programs[key]
-            return self.context.program(vertex_shader=vs, fragment_shader=fs)
-        raise Exception(f"program key is not found: {key}")
-
-
-class Recorder(Thread):
-    data_queue = Queue()
-    finish_event = Event()
-
-    def __init__(self, dst_path):
-        super(Recorder, self).__init__()
-        self.dst_path = dst_path
-
-    def run(self):
-        """
-        using multithread for dev (sublime IDE)
-        use multiprocessing package for production
-        (Thread -> Process)
-        """
-        print("recorder daemon started,")
-
-        writer = ii.get_writer(self.dst_path, fps=60)
-        while not self.finish_event.is_set():
-            while not self.data_queue.empty():
-                next_data = self.data_queue.get(False)
-                if next_data is not None:
-                    writer.append_data(next_data)
-            time.sleep(.100)
-        writer.close()
-        print("finished recording everything, closed writer!")
+        if key not in self._sources:
+            raise Exception(f"program key is not found: {key}")
+
+        stats = self._stats[key]
+        if key in self._programs:
+            stats["hits"] += 1
+            return self._programs[key][0]
+
+        stats["misses"] += 1
+        vs, fs = self._load(key)
+
+        programs = _program_cache(self.context)
+        compiled = programs.misses
+        start = time.perf_counter()
+        program = programs.program(vertex_shader=vs, fragment_shader=fs)
+        if programs.misses != compiled:
+            stats["compiles"] += 1
+            stats["compile_time"] += time.perf_counter() - start
+
+        self._programs[key] = (program, (vs, fs))
+        return program
+
+    def changed(self):
+        """ keys of compiled programs whose expanded sources differ from what was compiled """
+        return [key for key, (_, sources) in self._programs.items() if self._load(key) != sources]
+
+    def invalidate(self, key=None):
+        """ drop a compiled program, or all of them, meshes using it need rebuilding """
+        keys = [key] if key else list(self._programs.keys())
+        for key in keys:
+            if key in self._programs:
+                program, _ = self._programs.pop(key)
+
+                # identical sources under another key share the program
+                if all(shared is not program for shared, _ in self._programs.values()):
+                    _program_cache(self.context).discard(program)
+
+    def stats(self, key=None):
+        """ hits, misses, compiles and compile seconds of one key, or summed over all """
+        if key:
+            return dict(self._stats[key])
+
+        total = {"hits": 0, "misses": 0, "compiles": 0, "compile_time": 0.0}
+        for stats in self._stats.values():
+            for name in total:
+                total[name] += stats[name]
+        return total
+
+
+_pools = weakref.WeakKeyDictionary()
+
+
+def _program_pool(context):
+    """ one ProgramPool per context """
+    pool = _pools.get(context)
+    if pool is None:
+        pool = _pools[context] = ProgramPool(context)
+    return pool
+
+
+class Recorder(EncoderProcess):
+    """
+    mp4 writer running in its own process,
+    frames are handed over through shared memory
+    """
+
+    def __init__(self, dst_path, shape):
+        super(Recorder, self).__init__(dst_path, shape, fps=60)
 
 
 class Renderer(object):
@@ -86,7 +131,7 @@ class Renderer(object):
 
         self.init_scene()
 
-        self.output_texture = self.context.texture(self.render_size, 4, dtype='f4')
+        self.output_texture = self.context.texture(self.render_size, 4)
         self.framebuffer = self.context.framebuffer(self.output_texture)
         self.framebuffer.use()
 
@@ -94,7 +139,7 @@ class Renderer(object):
         return self
 
     def init_scene(self):
-        prog_pool = ProgramPool(self.context)
+        prog_pool = _program_pool(self.context)
         self.add_mesh(
             prog_pool.get('uvdebug'),
             np.array([
@@ -139,8 +184,13 @@ class Renderer(object):
 
     def render_pipeline(self):
         print("initializing recorder..")
-        recorder = Recorder("./result.mp4")
-        recorder.start()
+        recorder = Recorder("./result.mp4", (self.H, self.W, 4)).start()
+
+        # blocks while the encoder is behind
+        def enqueue(data):
+            recorder.put(data[::-1])
+
+        readback = AsyncReadback(self.context, self.render_size)
 
         print("start rendering..")
         LEN = 500
@@ -149,25 +199,27 @@ class Renderer(object):
             [
                 sys.stdout.write('\r'),
                 sys.stdout.flush(),
-                sys.stdout.write(f"rendering {i} / {LEN}..\r")
+                sys.stdout.write(
+                    f"rendering {i} / {LEN}.. "
+                    f"encoder: {recorder.throughput:.1f} fps, queue: {recorder.queue_depth}\r")
             ]
 
             self.render(i)
+            for data in readback.push(self.output_texture):
+                enqueue(data)
 
-            serial_data = self.output_texture.read()
-            data = np.frombuffer(serial_data, dtype='f4')
-            data = data * 255.0
-            data = data.astype(np.uint8)
-            data = data.reshape((*self.render_size, 4))
-            data = data[::-1]
-            recorder.data_queue.put(data)
+        for data in readback.flush():
+            enqueue(data)
 
         print("rendering finished!")
         print("waiting for writer..")
-        recorder.finish_event.set()
+        recorder.close()
+        print(f"writer finished! {recorder.encoded} frames at {recorder.throughput:.1f} fps")
 
-        recorder.join()
-        print("writer finished!")
+        stats = _program_pool(self.context).stats()
+        print(
+            f"programs: {stats['compiles']} compiled in {stats['compile_time'] * 1000.0:.1f} ms, "
+            f"{stats['hits']} hits, {stats['misses']} misses")
         return self
 
 if __name__ == "__main__":
@@ -5,6 +5,8 @@ import numpy as np
 import moderngl as mg
 import imageio
 
+from _readback import AsyncReadback
+
 
 verts = """
 #version 430
@@ -147,13 +149,19 @@ vao = ctx.vertex_array(program, [(
     "in_verts", "in_uvs"
 )], idx_buffer)
 
-target_tex = ctx.texture((width, height), 4, dtype='f4')
+target_tex = ctx.texture((width, height), 4)
 framebuffer = ctx.framebuffer([target_tex])
 
 print("rendering..")
 render_start_time = time.time()
 
+
+def write(data):
+    writer.append_data(data[::-1])
+
+
 writer = imageio.get_writer("result.mp4", fps=25)
+readback = AsyncReadback(ctx, (width, height))
 for i in range(2 ** 5):
     if not i % 2 ** 6:
         print(f"\trendering frame idx: {i:4}..")
@@ -163,15 +171,10 @@ for i in range(2 ** 5):
     target_tex.use(0)
     framebuffer.use()
     vao.render()
-    frame_result = target_tex.read()
-
-    data = np.frombuffer(frame_result, dtype='f4')
-    data = data.reshape((width, height, 4))
-    data = data[::-1]
-    data = data * 255.0
-    data = data.astype(np.uint8)
-
-    writer.append_data(data)
+    for data in readback.push(target_tex):
+        write(data)
 
+for data in readback.flush():
+    write(data)
 writer.close()
 print(f"spent time for rendering: {time.time() - render_start_time:.2f}")
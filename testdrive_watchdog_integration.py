@@ -1,6 +1,5 @@
 
 import numpy as np
-import moderngl as mg
 
 from PIL import Image
 from PIL.ImageQt import ImageQt
@@ -12,13 +11,16 @@ from PyQt5.QtCore import QThread
 from PyQt5.QtCore import pyqtSignal
 
 from watchdog.observers import Observer
-from watchdog.events import FileSystemEventHandler
 
 from _common import _read
 from _common import _flatten_array
+from _compute import _compute_engine
+from _hotreload import ReloadCoordinator
 
 
-def _compute_driven_generation(width, height, cs_path):
+def _compute_driven_generation(width, height, cs_path, engine=None):
+    engine = engine or _compute_engine()
+
     x, y, z = width, 1, 1
     args = {
         'X': x,
@@ -27,59 +29,49 @@ def _compute_driven_generation(width, height, cs_path):
         'WIDTH': width,
         'HEIGHT': height,
     }
-    cs = _read(cs_path, args)
-
-    context = mg.create_standalone_context()
-    compute_shader = context.compute_shader(cs)
-
-    in_data = np.random.uniform(0.0, 1.0, (width, height, 4))
-    out_data = np.zeros((width, height, 4))
+    compute_shader = engine.program(_read, cs_path, args)
 
-    in_buffer = context.buffer(in_data.astype('f4'))
-    in_buffer.bind_to_storage_buffer(0)
+    size = width * height * 4 * 4
+    engine.storage_buffer(
+        0, size,
+        lambda: np.random.uniform(0.0, 1.0, (width, height, 4)).astype('f4'))
+    out_buffer = engine.storage_buffer(1, size)
 
-    out_buffer = context.buffer(out_data.astype('f4'))
-    out_buffer.bind_to_storage_buffer(1)
+    engine.run(compute_shader, x, y, z)
 
-    compute_shader.run(x, y, z)
-
-    data = np.frombuffer(out_buffer.read(), dtype='f4')
+    data = np.frombuffer(engine.read(out_buffer), dtype='f4')
     data = data.reshape((height, width, 4))
     return _flatten_array(data)
 
 
 class QtObserver(QThread):
-    ''' glues qt thread with watchdog observer thread '''
+    '''
+    glues qt thread with watchdog observer thread,
+    signals once per burst of edits to the followed shaders or their includes
+    '''
 
     signal_glue = pyqtSignal()
 
-    def __init__(self, watch_path):
+    def __init__(self, watch_path, follow=(), window=0.15):
         super(QtObserver, self).__init__()
 
         self.watch_path = watch_path
+        self.coordinator = ReloadCoordinator(self.on_watch, window)
+        self.coordinator.follow(*follow)
 
-    def on_watch(self):
+    def on_watch(self, paths=None):
         self.signal_glue.emit()
 
     def run(self):
-        observer = Observer()
+        self.on_watch()
 
-        event_handler = OnChangeHandler(self.on_watch)
-        observer.schedule(event_handler, self.watch_path)
+        observer = Observer()
+        observer.schedule(self.coordinator, self.watch_path)
         observer.start()
 
         observer.join()
 
 
-class OnChangeHandler(FileSystemEventHandler):
-    def __init__(self, on_mod_callback):
-        self.on_mod_callback = on_mod_callback
-        self.on_mod_callback()
-
-    def on_modified(self, event):
-        self.on_mod_callback()
-
-
 class ComputeShaderViewer(QtWidgets.QLabel):
     def __init__(self, size):
         super(ComputeShaderViewer, self).__init__()
@@ -88,7 +80,7 @@ class ComputeShaderViewer(QtWidgets.QLabel):
         self.shader_path = "./gl/tex_gen/compute_median.glsl"
         self.watch_path = "./gl/tex_gen/"
 
-        self.observer = QtObserver(self.watch_path)
+        self.observer = QtObserver(self.watch_path, follow=[self.shader_path])
         self.observer.signal_glue.connect(self.recompile_compute_shader)
         self.observer.start()
 